@@ -0,0 +1,9 @@
+import pytest
+
+from core.runner import isolated_settings
+
+
+@pytest.fixture(autouse=True, scope='session')
+def isolated_files(tmp_path_factory):
+    with isolated_settings(str(tmp_path_factory.mktemp('yatube'))):
+        yield
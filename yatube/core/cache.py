@@ -0,0 +1,234 @@
+import pickle
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from .sqlite import LocalConnection
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires REAL,
+    accessed REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cache_accessed_idx ON cache (accessed);
+CREATE TABLE IF NOT EXISTS cache_stats (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    entries INTEGER NOT NULL,
+    bytes INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO cache_stats VALUES (0, 0, 0);
+CREATE TRIGGER IF NOT EXISTS cache_insert AFTER INSERT ON cache BEGIN
+    UPDATE cache_stats
+    SET entries = entries + 1, bytes = bytes + new.size;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_update AFTER UPDATE OF size ON cache BEGIN
+    UPDATE cache_stats SET bytes = bytes - old.size + new.size;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_delete AFTER DELETE ON cache BEGIN
+    UPDATE cache_stats
+    SET entries = entries - 1, bytes = bytes - old.size;
+END;
+'''
+
+UPSERT = '''
+INSERT INTO cache (key, value, expires, accessed, size)
+VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (key) DO UPDATE SET
+    value = excluded.value,
+    expires = excluded.expires,
+    accessed = excluded.accessed,
+    size = excluded.size
+'''
+
+# Не чаще раза в столько секунд чтение обновляет отметку LRU:
+# иначе каждое попадание было бы записью в файл
+ACCESS_RESOLUTION = 1.0
+
+
+class SQLiteCache(BaseCache):
+    """Кэш в файле SQLite в режиме WAL, общий для всех процессов хоста.
+
+    LOCATION - путь к файлу. Кроме MAX_ENTRIES и CULL_FREQUENCY
+    понимает OPTIONS['MAX_SIZE'] - предел суммарного размера значений
+    в байтах. При превышении пределов вытесняются давно не читанные
+    записи.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._max_size = params.get('OPTIONS', {}).get('MAX_SIZE')
+        self._connection = LocalConnection(location, SCHEMA)
+
+    @property
+    def _db(self):
+        return self._connection.get()
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _write(self, db, key, value, timeout, now):
+        blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        expires = self.get_backend_timeout(timeout)
+        db.execute(UPSERT, (key, blob, expires, now, len(blob)))
+
+    def _touch_read(self, db, rows, now):
+        """Обновляет отметку LRU у давно не читанных ключей."""
+        stale = [key for key, accessed in rows
+                 if accessed < now - ACCESS_RESOLUTION]
+        if stale:
+            db.executemany(
+                'UPDATE cache SET accessed = ? WHERE key = ?',
+                [(now, key) for key in stale],
+            )
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        return self._get_many([key]).get(key, default)
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        found = self._get_many(list(keys))
+        return {keys[key]: value for key, value in found.items()}
+
+    def _get_many(self, keys):
+        if not keys:
+            return {}
+        db = self._db
+        now = time.time()
+        rows = []
+        # Держим число параметров ниже лимита SQLite
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows += db.execute(
+                'SELECT key, value, accessed FROM cache '
+                'WHERE key IN ({}) AND (expires IS NULL OR expires > ?)'
+                .format(', '.join('?' * len(chunk))),
+                (*chunk, now),
+            ).fetchall()
+        self._touch_read(
+            db, [(key, accessed) for key, _, accessed in rows], now)
+        return {key: pickle.loads(value) for key, value, _ in rows}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        now = time.time()
+        with self._connection.transaction() as db:
+            for key, value in data.items():
+                self._write(db, self._key(key, version), value, timeout, now)
+            self._cull(db, now)
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        with self._connection.transaction() as db:
+            exists = db.execute(
+                'SELECT 1 FROM cache '
+                'WHERE key = ? AND (expires IS NULL OR expires > ?)',
+                (key, now),
+            ).fetchone()
+            if not exists:
+                self._write(db, key, value, timeout, now)
+                self._cull(db, now)
+        return not exists
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        # Чтение и запись в одной транзакции: параллельные incr из
+        # других процессов не теряются
+        with self._connection.transaction() as db:
+            row = db.execute(
+                'SELECT value FROM cache '
+                'WHERE key = ? AND (expires IS NULL OR expires > ?)',
+                (key, now),
+            ).fetchone()
+            if row is None:
+                raise ValueError("Key '%s' not found" % key)
+            value = pickle.loads(row[0]) + delta
+            blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            db.execute(
+                'UPDATE cache SET value = ?, size = ?, accessed = ? '
+                'WHERE key = ?',
+                (blob, len(blob), now, key),
+            )
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        cursor = self._db.execute(
+            'UPDATE cache SET expires = ?, accessed = ? '
+            'WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (self.get_backend_timeout(timeout), now, key, now),
+        )
+        return bool(cursor.rowcount)
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        return self._db.execute(
+            'SELECT 1 FROM cache '
+            'WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (key, time.time()),
+        ).fetchone() is not None
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version)
+
+    def delete_many(self, keys, version=None):
+        keys = [self._key(key, version) for key in keys]
+        if not keys:
+            return
+        # Одна транзакция на все ключи: без неё каждый DELETE
+        # брал бы блокировку записи в файл отдельно
+        with self._connection.transaction() as db:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                db.execute(
+                    'DELETE FROM cache WHERE key IN ({})'
+                    .format(', '.join('?' * len(chunk))),
+                    chunk,
+                )
+
+    def clear(self):
+        self._db.execute('DELETE FROM cache')
+
+    def _over(self, db):
+        entries, size = db.execute(
+            'SELECT entries, bytes FROM cache_stats').fetchone()
+        return entries, (
+            entries > self._max_entries
+            or (self._max_size is not None and size > self._max_size)
+        )
+
+    def _cull(self, db, now):
+        """Вытесняет просроченные, затем давно не читанные записи."""
+        entries, over = self._over(db)
+        if not over:
+            return
+        db.execute(
+            'DELETE FROM cache WHERE expires IS NOT NULL AND expires <= ?',
+            (now,))
+        entries, over = self._over(db)
+        if over and self._cull_frequency == 0:
+            db.execute('DELETE FROM cache')
+            return
+        while over and entries:
+            db.execute(
+                'DELETE FROM cache WHERE key IN ('
+                'SELECT key FROM cache ORDER BY accessed LIMIT ?)',
+                (max(entries // self._cull_frequency, 1),),
+            )
+            entries, over = self._over(db)
+
+    def close(self, **kwargs):
+        # Соединение живёт дольше запроса: открывать файл и проверять
+        # схему на каждый запрос дорого
+        pass
@@ -0,0 +1,97 @@
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+from core.cache import SQLiteCache
+
+
+def backends(directory, max_entries):
+    """Фабрики кэшей: каждый процесс строит свой экземпляр."""
+    params = {'OPTIONS': {'MAX_ENTRIES': max_entries}}
+    return {
+        'locmem': lambda: LocMemCache('bench', params),
+        'file': lambda: FileBasedCache(
+            os.path.join(directory, 'file'), params),
+        'sqlite': lambda: SQLiteCache(
+            os.path.join(directory, 'cache.sqlite3'), params),
+    }
+
+
+def write_in_child(factory):
+    factory().set('bench:shared', 'written by another process')
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает LocMemCache, FileBasedCache и SQLiteCache: время '
+        'операций и видят ли процессы записи друг друга.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keys', type=int, default=300)
+        parser.add_argument('--rounds', type=int, default=5)
+        parser.add_argument(
+            '--size', type=int, default=2048,
+            help='Размер значения в байтах (карточка или страница).',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f'{"backend":<8} {"set us":>8} {"get us":>8} '
+            f'{"get_many us":>12} {"incr us":>8} {"shared":>7}'
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            # Запас по числу записей: бенчмарк не должен мерить вытеснение
+            max_entries = options['keys'] * 2
+            for name, factory in backends(directory, max_entries).items():
+                timings = self.measure(factory(), **options)
+                self.stdout.write(
+                    f'{name:<8} {timings["set"]:>8.1f} '
+                    f'{timings["get"]:>8.1f} '
+                    f'{timings["get_many"]:>12.1f} '
+                    f'{timings["incr"]:>8.1f} '
+                    f'{"yes" if self.shared(factory) else "no":>7}'
+                )
+
+    def measure(self, cache, keys, rounds, size, **options):
+        """Медиана по раундам времени одной операции, мкс."""
+        names = [f'bench:{number}' for number in range(keys)]
+        value = 'x' * size
+        cache.set('bench:counter', 0)
+        operations = {
+            'set': lambda: [cache.set(key, value) for key in names],
+            'get': lambda: [cache.get(key) for key in names],
+            # Как страница ленты: десять карточек за раз
+            'get_many': lambda: [
+                cache.get_many(names[start:start + 10])
+                for start in range(0, keys, 10)
+            ],
+            'incr': lambda: [cache.incr('bench:counter') for _ in names],
+        }
+        calls = {'get_many': len(range(0, keys, 10))}
+        timings = {}
+        for operation, run in operations.items():
+            samples = []
+            for _ in range(rounds):
+                start = time.perf_counter()
+                run()
+                samples.append(
+                    (time.perf_counter() - start)
+                    / calls.get(operation, keys) * 1e6)
+            timings[operation] = statistics.median(samples)
+        cache.clear()
+        return timings
+
+    def shared(self, factory):
+        """Видит ли этот процесс запись, сделанную другим процессом."""
+        process = multiprocessing.get_context('fork').Process(
+            target=write_in_child, args=(factory,))
+        process.start()
+        process.join()
+        return factory().get('bench:shared') is not None
@@ -0,0 +1,236 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.template.backends.django import DjangoTemplates, Template
+
+from .sqlite import LocalConnection
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS metrics (
+    name TEXT NOT NULL,
+    view TEXT NOT NULL,
+    le TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (name, view, le)
+) WITHOUT ROWID;
+'''
+
+ADD = '''
+INSERT INTO metrics (name, view, le, value) VALUES (?, ?, ?, ?)
+ON CONFLICT (name, view, le) DO UPDATE SET value = value + excluded.value
+'''
+
+# Верхние границы корзин гистограммы времени ответа, секунды
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+DURATION = 'yatube_request_duration_seconds'
+COUNTERS = {
+    'yatube_request_queries_total': 'Запросов к базе',
+    'yatube_request_sql_seconds_total': 'Время в запросах к базе, секунды',
+    'yatube_request_template_seconds_total': 'Время шаблонов, секунды',
+}
+
+
+def bucket(seconds):
+    """Граница первой корзины, куда попадает seconds."""
+    for bound in BUCKETS:
+        if seconds <= bound:
+            return str(bound)
+    return '+Inf'
+
+
+class MetricsStore:
+    """Метрики запросов в файле SQLite, общем для процессов хоста.
+
+    Процесс копит приращения в памяти, а фоновый поток раз
+    в flush_interval секунд дописывает их в файл одной транзакцией:
+    запрос не ждёт ни записи, ни блокировки файла. Файл открывается
+    через core.sqlite.LocalConnection, как и у core.cache.SQLiteCache.
+    """
+
+    def __init__(self, path, flush_interval):
+        self._connection = LocalConnection(path, SCHEMA)
+        self._flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._pending = defaultdict(float)
+        self._flusher_pid = None
+        atexit.register(self.flush)
+
+    def observe(self, view, duration, queries, sql, template):
+        """Учитывает один запрос к представлению view."""
+        with self._lock:
+            pending = self._pending
+            pending[DURATION + '_bucket', view, bucket(duration)] += 1
+            pending[DURATION + '_sum', view, ''] += duration
+            pending['yatube_request_queries_total', view, ''] += queries
+            pending['yatube_request_sql_seconds_total', view, ''] += sql
+            pending[
+                'yatube_request_template_seconds_total', view, ''] += template
+            if self._flusher_pid != os.getpid():
+                # Потоки не переживают fork: у каждого процесса свой
+                self._flusher_pid = os.getpid()
+                threading.Thread(
+                    target=self._flush_forever,
+                    name='metrics-flush',
+                    daemon=True,
+                ).start()
+
+    def _flush_forever(self):
+        while True:
+            time.sleep(self._flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Не удалось записать метрики')
+
+    def flush(self):
+        """Дописывает накопленные приращения в файл."""
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(float)
+        if not pending:
+            return
+        try:
+            with self._connection.transaction() as db:
+                db.executemany(
+                    ADD, [(*key, value) for key, value in pending.items()])
+        except BaseException:
+            # Приращения не пропадают: их допишет следующий flush
+            with self._lock:
+                for key, value in pending.items():
+                    self._pending[key] += value
+            raise
+
+    def rows(self):
+        return self._connection.get().execute(
+            'SELECT name, view, le, value FROM metrics').fetchall()
+
+    def export(self):
+        """Все метрики в текстовом формате Prometheus."""
+        self.flush()
+        buckets = defaultdict(dict)
+        values = defaultdict(dict)
+        for name, view, le, value in self.rows():
+            if le:
+                buckets[view][le] = value
+            else:
+                values[name][view] = value
+        lines = [
+            f'# HELP {DURATION} Время ответа по представлениям, секунды',
+            f'# TYPE {DURATION} histogram',
+        ]
+        for view in sorted(buckets):
+            label = f'view="{escape(view)}"'
+            # В файле у каждой корзины своё число, в выдаче - накопленное
+            total = 0
+            for le in [*map(str, BUCKETS), '+Inf']:
+                total += buckets[view].get(le, 0)
+                lines.append(
+                    f'{DURATION}_bucket{{{label},le="{le}"}} {number(total)}')
+            lines.append(
+                f'{DURATION}_sum{{{label}}} '
+                f'{number(values[DURATION + "_sum"].get(view, 0))}')
+            lines.append(f'{DURATION}_count{{{label}}} {number(total)}')
+        for name, help_text in COUNTERS.items():
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+            for view, value in sorted(values[name].items()):
+                lines.append(
+                    f'{name}{{view="{escape(view)}"}} {number(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def number(value):
+    # :g округлил бы большие счётчики до шести знаков
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def escape(value):
+    return (value.replace('\\', '\\\\').replace('\n', '\\n')
+            .replace('"', '\\"'))
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store():
+    """Хранилище из настройки METRICS_LOCATION; None - метрики выключены."""
+    path = settings.METRICS_LOCATION
+    if path is None:
+        return None
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = MetricsStore(
+                path, settings.METRICS_FLUSH_INTERVAL)
+        return _stores[path]
+
+
+# Замеры текущего запроса; их заполняют обёртка запросов к базе
+# и шаблонный движок ниже
+_current = threading.local()
+
+
+class Timings:
+    __slots__ = ('queries', 'sql', 'template', 'depth')
+
+    def __init__(self):
+        self.queries = 0
+        self.sql = 0.0
+        self.template = 0.0
+        self.depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # Обёртка для connection.execute_wrapper
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql += time.perf_counter() - started
+            self.queries += 1
+
+
+@contextmanager
+def measure():
+    """Собирает Timings для кода внутри блока."""
+    timings = Timings()
+    _current.timings = timings
+    try:
+        yield timings
+    finally:
+        _current.timings = None
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        timings = getattr(_current, 'timings', None)
+        if timings is None:
+            return super().render(context, request)
+        # Вложенные отрисовки (render_to_string в теге) уже входят
+        # во время внешней
+        timings.depth += 1
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            timings.depth -= 1
+            if not timings.depth:
+                timings.template += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """Движок DjangoTemplates, который замеряет время отрисовки."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return TimedTemplate(template.template, self)
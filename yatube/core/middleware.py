@@ -0,0 +1,36 @@
+import time
+from contextlib import ExitStack
+
+from django.db import connections
+
+from .metrics import get_store, measure
+
+
+class MetricsMiddleware:
+    """Замеряет время ответа, запросы к базе и отрисовку шаблонов.
+
+    Метрики ведутся по имени представления (posts:index, ...), чтобы
+    число рядов не зависело от адресов запросов.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        store = get_store()
+        if store is None:
+            return self.get_response(request)
+        started = time.perf_counter()
+        with measure() as timings, ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timings))
+            response = self.get_response(request)
+        match = request.resolver_match
+        store.observe(
+            match.view_name if match else '<unresolved>',
+            time.perf_counter() - started,
+            timings.queries,
+            timings.sql,
+            timings.template,
+        )
+        return response
@@ -0,0 +1,37 @@
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+
+
+def isolated_settings(directory):
+    """Настройки, которые отделяют тесты от файлов сервера.
+
+    Кэш - тот же SQLiteCache, но в файле из directory: у тестов своя
+    база, и версии страниц сервера им не подходят. Метрики выключены.
+    """
+    return override_settings(
+        CACHES={
+            'default': {
+                **settings.CACHES['default'],
+                'LOCATION': os.path.join(directory, 'cache.sqlite3'),
+            },
+        },
+        METRICS_LOCATION=None,
+    )
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.directory = tempfile.mkdtemp()
+        self.isolated = isolated_settings(self.directory)
+        self.isolated.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.isolated.disable()
+        shutil.rmtree(self.directory, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,46 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+class LocalConnection:
+    """Соединение с файлом SQLite в режиме WAL, общим для процессов хоста.
+
+    Соединение своё у каждого потока и у каждого процесса после fork;
+    при открытии файл получает схему schema.
+    """
+
+    def __init__(self, path, schema):
+        self.path = path
+        self.schema = schema
+        self._local = threading.local()
+
+    def get(self):
+        db = getattr(self._local, 'db', None)
+        if db is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(
+                self.path, timeout=30, isolation_level=None,
+                check_same_thread=False,
+            )
+            db.execute('PRAGMA journal_mode = WAL')
+            db.execute('PRAGMA synchronous = NORMAL')
+            db.executescript(self.schema)
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    @contextmanager
+    def transaction(self):
+        """Пишущая транзакция: блокировка берётся сразу, а не при записи."""
+        db = self.get()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            yield db
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
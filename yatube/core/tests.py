@@ -0,0 +1,206 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from core.cache import ACCESS_RESOLUTION, SQLiteCache
+from core.metrics import MetricsStore
+
+
+class SQLiteCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'cache.sqlite3')
+        self.cache = self.make_cache()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def make_cache(self, **options):
+        return SQLiteCache(self.path, {'OPTIONS': options})
+
+    def test_basic_operations(self):
+        """Кэш хранит, обновляет и удаляет значения."""
+        self.cache.set('key', {'value': 1})
+        self.assertEqual(self.cache.get('key'), {'value': 1})
+        self.assertFalse(self.cache.add('key', 'other'))
+        self.assertTrue(self.cache.add('new', 'value'))
+        self.cache.set('counter', 1)
+        self.assertEqual(self.cache.incr('counter'), 2)
+        self.assertEqual(self.cache.get('counter'), 2)
+        self.assertEqual(
+            self.cache.get_many(['key', 'new', 'missing']),
+            {'key': {'value': 1}, 'new': 'value'},
+        )
+        self.cache.delete('key')
+        self.assertIsNone(self.cache.get('key'))
+        self.assertTrue(self.cache.has_key('new'))
+        self.cache.clear()
+        self.assertFalse(self.cache.has_key('new'))
+
+    def test_incr_missing_key(self):
+        """incr отсутствующего ключа - ValueError, как у других кэшей."""
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def test_expiry(self):
+        """Просроченное значение не возвращается и уступает add."""
+        self.cache.set('key', 'value', timeout=-1)
+        self.assertIsNone(self.cache.get('key'))
+        self.assertTrue(self.cache.add('key', 'new'))
+        self.cache.set('forever', 'value', timeout=None)
+        self.assertTrue(self.cache.touch('forever', 60))
+        self.assertEqual(self.cache.get('forever'), 'value')
+
+    def test_shared_between_instances(self):
+        """Запись и сброс видны другому экземпляру на том же файле."""
+        other = self.make_cache()
+        self.cache.set('key', 'value')
+        self.assertEqual(other.get('key'), 'value')
+        other.delete('key')
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_delete_many_in_one_transaction(self):
+        """delete_many берёт блокировку записи один раз на все ключи."""
+        cache = self.make_cache(MAX_ENTRIES=2000)
+        keys = [f'key_{number}' for number in range(1200)]
+        cache.set_many(dict.fromkeys(keys, 'value'))
+        cache.set('kept', 'value')
+        connection = cache._connection
+        with mock.patch.object(
+                connection, 'transaction',
+                wraps=connection.transaction) as transaction:
+            cache.delete_many(keys)
+        transaction.assert_called_once_with()
+        self.assertEqual(cache.get_many(keys), {})
+        self.assertEqual(
+            cache._db.execute(
+                'SELECT entries FROM cache_stats').fetchone()[0], 1)
+
+    def test_lru_eviction_by_entries(self):
+        """При переполнении вытесняются давно не читанные записи."""
+        cache = self.make_cache(MAX_ENTRIES=4, CULL_FREQUENCY=2)
+        past = time.time() - ACCESS_RESOLUTION * 10
+        for number in range(4):
+            cache.set(f'key_{number}', number)
+        # key_0 читали недавно, остальные - давно
+        cache._db.execute('UPDATE cache SET accessed = ?', (past,))
+        cache.get('key_0')
+        cache.set('key_4', 4)
+        self.assertTrue(cache.has_key('key_0'))
+        self.assertTrue(cache.has_key('key_4'))
+        self.assertEqual(
+            sum(cache.has_key(f'key_{number}') for number in range(5)), 3)
+
+    def test_eviction_by_size(self):
+        """Суммарный размер значений не превышает MAX_SIZE."""
+        cache = self.make_cache(MAX_SIZE=10 * 1024)
+        for number in range(20):
+            cache.set(f'key_{number}', 'x' * 1024)
+        entries, size = cache._db.execute(
+            'SELECT entries, bytes FROM cache_stats').fetchone()
+        self.assertLessEqual(size, 10 * 1024)
+        self.assertEqual(
+            entries,
+            cache._db.execute('SELECT COUNT(*) FROM cache').fetchone()[0])
+        self.assertTrue(cache.has_key('key_19'))
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'metrics.sqlite3')
+        settings = override_settings(
+            METRICS_LOCATION=self.path, METRICS_TOKEN='secret')
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_request_metrics(self):
+        """Запрос учитывается по имени представления с базой и шаблонами."""
+        self.client.get('/')
+        self.client.get('/')
+        self.client.get('/missing/page/')
+        body = self.client.get(
+            '/metrics', HTTP_AUTHORIZATION='Bearer secret').content.decode()
+        self.assertIn('# TYPE yatube_request_duration_seconds histogram', body)
+        self.assertIn(
+            'yatube_request_duration_seconds_count{view="posts:index"} 2',
+            body)
+        self.assertIn(
+            'yatube_request_duration_seconds_bucket'
+            '{view="posts:index",le="+Inf"} 2', body)
+        self.assertIn('{view="<unresolved>"}', body)
+        for name in ('queries_total', 'sql_seconds_total',
+                     'template_seconds_total'):
+            line, = [line for line in body.splitlines() if line.startswith(
+                f'yatube_request_{name}{{view="posts:index"}}')]
+            self.assertGreater(float(line.split()[-1]), 0)
+
+    def test_processes_share_metrics(self):
+        """Приращения разных процессов складываются в одном файле."""
+        first = MetricsStore(self.path, flush_interval=60)
+        second = MetricsStore(self.path, flush_interval=60)
+        first.observe('posts:index', 0.02, 3, 0.01, 0.005)
+        second.observe('posts:index', 7, 1, 0.5, 0.1)
+        # До сброса приращения лежат в памяти процесса: запрос
+        # не пишет в файл
+        self.assertEqual(first.rows(), [])
+        second.flush()
+        body = first.export()
+        self.assertIn(
+            'yatube_request_duration_seconds_bucket'
+            '{view="posts:index",le="0.025"} 1', body)
+        self.assertIn(
+            'yatube_request_duration_seconds_bucket'
+            '{view="posts:index",le="10"} 2', body)
+        self.assertIn(
+            'yatube_request_queries_total{view="posts:index"} 4', body)
+
+    def test_background_flush(self):
+        """Приращения попадают в файл из фонового потока."""
+        store = MetricsStore(self.path, flush_interval=0.01)
+        store.observe('posts:index', 0.02, 3, 0.01, 0.005)
+        deadline = time.monotonic() + 5
+        while not store.rows() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(store.rows())
+
+    def test_failed_flush_keeps_metrics(self):
+        """Приращения неудачной записи дописывает следующий flush."""
+        store = MetricsStore(self.path, flush_interval=60)
+        store.observe('posts:index', 0.02, 3, 0.01, 0.005)
+        locked = sqlite3.OperationalError('database is locked')
+        with mock.patch.object(
+                store._connection, 'transaction', side_effect=locked):
+            with self.assertRaises(sqlite3.OperationalError):
+                store.flush()
+        store.observe('posts:index', 0.02, 2, 0.01, 0.005)
+        self.assertIn(
+            'yatube_request_queries_total{view="posts:index"} 5',
+            store.export())
+
+    def test_metrics_access(self):
+        """Метрики открыты по токену и сотрудникам, но не по адресу."""
+        local = {'REMOTE_ADDR': '127.0.0.1'}
+        self.assertEqual(
+            self.client.get('/metrics', **local).status_code, 403)
+        self.assertEqual(
+            self.client.get(
+                '/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code,
+            403)
+        self.assertEqual(
+            self.client.get(
+                '/metrics', HTTP_AUTHORIZATION='Bearer secret').status_code,
+            200)
+        staff = get_user_model().objects.create_user(
+            username='staff', is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
@@ -1,4 +1,10 @@
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpResponse
 from django.shortcuts import render
+from django.utils.crypto import constant_time_compare
+
+from .metrics import get_store
 
 
 def page_not_found(request, exception):
@@ -17,3 +23,25 @@ def permission_denied(request, exception):
 
 def csrf_failure(request, reason=''):
     return render(request, 'core/403csrf.html')
+
+
+def has_metrics_token(request):
+    token = settings.METRICS_TOKEN
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    return bool(token) and constant_time_compare(header, f'Bearer {token}')
+
+
+def metrics(request):
+    """Метрики запросов в текстовом формате Prometheus.
+
+    Доступны сотрудникам и по заголовку Authorization: Bearer
+    с METRICS_TOKEN. Адресу клиента не верим: за обратным прокси
+    все запросы приходят с 127.0.0.1.
+    """
+    store = get_store()
+    if store is None:
+        raise Http404
+    if not request.user.is_staff and not has_metrics_token(request):
+        raise PermissionDenied
+    return HttpResponse(
+        store.export(), content_type='text/plain; version=0.0.4')
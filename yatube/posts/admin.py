@@ -1,10 +1,60 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.db.models import Q
+from django.template.response import TemplateResponse
 
-from .models import Group, Post
+from . import bulk
+from .counts import count_of, scope_count
+from .helper import AllPostsPaginator, EstimatedCountPaginator
+from .models import AuthorStats, Comment, Follow, Group, Post, User
+from .search import matching, matching_comments
+
+
+class PostActionForm(helpers.ActionForm):
+    group = forms.IntegerField(
+        label='id группы',
+        required=False,
+        min_value=1,
+    )
+
+
+def confirm_bulk_delete(modeladmin, request, queryset, delete):
+    """Удаляет queryset через delete после подтверждения.
+
+    В отличие от встроенного delete_selected, страница подтверждения
+    не собирает связанные объекты, а показывает только их число.
+    """
+    if request.POST.get('post'):
+        deleted = delete(queryset)
+        modeladmin.message_user(request, f'Удалено: {deleted}')
+        return None
+    opts = modeladmin.model._meta
+    context = {
+        **modeladmin.admin_site.each_context(request),
+        'title': 'Удаление',
+        'opts': opts,
+        'count': scope_count(queryset.values('pk')),
+        'action': request.POST['action'],
+        'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+        'selected': request.POST.getlist(helpers.ACTION_CHECKBOX_NAME),
+        'select_across': request.POST.get('select_across') == '1',
+    }
+    return TemplateResponse(
+        request, 'admin/posts/bulk_delete_confirmation.html', context)
+
+
+class BulkDeleteMixin:
+    """Заменяет delete_selected на удаление порциями из posts.bulk."""
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
 
 
 @admin.register(Post)
-class PostAdmin(admin.ModelAdmin):
+class PostAdmin(BulkDeleteMixin, admin.ModelAdmin):
     list_display = (
         'pk',
         'text',
@@ -12,10 +62,113 @@ class PostAdmin(admin.ModelAdmin):
         'author',
         'group',
     )
+    list_select_related = ('author', 'group')
     search_fields = ('text',)
+    # Фильтры по дате - диапазоны по индексу post_pub_date_idx
     list_filter = ('pub_date',)
     list_editable = ('group',)
+    # Поле для pk вместо <select> из всех групп и пользователей
+    raw_id_fields = ('author', 'group')
+    paginator = AllPostsPaginator
+    show_full_result_count = False
     empty_value_display = '-пусто-'
+    action_form = PostActionForm
+    actions = ('move_to_group', 'clear_group', 'delete_posts')
+
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск по индексу FTS5 из posts.search вместо LIKE '%...%'
+        # по всем текстам
+        if not search_term.strip():
+            return queryset, False
+        return matching(queryset, search_term), False
+
+    def move_to_group(self, request, queryset):
+        group = Group.objects.filter(
+            pk=request.POST.get('group') or None).first()
+        if group is None:
+            self.message_user(
+                request, 'Укажите id существующей группы', messages.ERROR)
+            return
+        moved = bulk.move_posts(queryset, group)
+        self.message_user(request, f'Перенесено в «{group}»: {moved}')
+    move_to_group.short_description = 'Перенести в группу (id ниже)'
+
+    def clear_group(self, request, queryset):
+        moved = bulk.move_posts(queryset, None)
+        self.message_user(request, f'Убрано из групп: {moved}')
+    clear_group.short_description = 'Убрать из группы'
+
+    def delete_posts(self, request, queryset):
+        return confirm_bulk_delete(self, request, queryset, bulk.delete_posts)
+    delete_posts.short_description = 'Удалить выбранные записи'
+
+
+@admin.register(Comment)
+class CommentAdmin(BulkDeleteMixin, admin.ModelAdmin):
+    list_display = (
+        'pk',
+        'text',
+        'created',
+        'author',
+        'author_comments',
+        'post',
+    )
+    list_select_related = ('author', 'post')
+    search_fields = ('text',)
+    # Диапазоны и порядок по индексу comment_created_idx
+    list_filter = ('created',)
+    ordering = ('-created', '-id')
+    raw_id_fields = ('author', 'post')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ('delete_comments',)
+
+    def get_queryset(self, request):
+        # Подзапрос по индексу author_id считается только для строк
+        # страницы: пагинатор его отбрасывает
+        return super().get_queryset(request).annotate(
+            author_comments_count=count_of(Comment, 'author', 'author'))
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        return matching_comments(queryset, search_term), False
+
+    def author_comments(self, comment):
+        return comment.author_comments_count
+    author_comments.short_description = 'Комментариев автора'
+    author_comments.admin_order_field = 'author_comments_count'
+
+    def delete_comments(self, request, queryset):
+        return confirm_bulk_delete(
+            self, request, queryset, bulk.delete_comments)
+    delete_comments.short_description = 'Удалить выбранные комментарии'
+
+
+@admin.register(Follow)
+class FollowAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'user', 'author', 'author_followers')
+    # Число подписчиков берётся из денормализованной AuthorStats
+    list_select_related = ('user', 'author__stats')
+    search_fields = ('user__username', 'author__username')
+    raw_id_fields = ('user', 'author')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        # Точное имя через уникальный индекс username, подписки -
+        # по индексам (user, author) и (author, user), без LIKE
+        if not search_term.strip():
+            return queryset, False
+        users = User.objects.filter(
+            username=search_term.strip()).values('pk')
+        return queryset.filter(
+            Q(user__in=users) | Q(author__in=users)), False
+
+    def author_followers(self, follow):
+        return AuthorStats.for_user(follow.author).followers_count
+    author_followers.short_description = 'Подписчиков автора'
+    author_followers.admin_order_field = 'author__stats__followers_count'
 
 
 admin.site.register(Group)
@@ -0,0 +1,108 @@
+from collections import Counter
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import feeds
+from .counts import count_of, forget_counts, shift_counts
+from .helper import chunks
+from .models import AuthorStats, Comment, FeedEntry, Post
+from .signals import post_scopes, release_image
+from .versions import bump
+
+# Сколько строк менять одним запросом
+BULK_BATCH_SIZE = 1000
+
+# Правки идут одним UPDATE или DELETE на порцию, сигналы моделей
+# не срабатывают. Всё, что они поддерживают (счётчики, статистика
+# авторов, версии страниц, ленты, картинки), правится здесь по итогам
+# порции.
+
+
+def move_posts(queryset, group, size=BULK_BATCH_SIZE):
+    """Переносит записи queryset в group; None убирает группу.
+
+    Возвращает число перенесённых записей.
+    """
+    group_id = group and group.pk
+    moved = 0
+    for pks in chunks(queryset.exclude(group=group), size):
+        with transaction.atomic():
+            posts = Post.objects.filter(pk__in=pks)
+            rows = list(posts.values_list('group_id', 'author_id'))
+            # updated меняет ключ карточки: на ней название группы
+            posts.update(group_id=group_id, updated=timezone.now())
+        moved_from = Counter(previous for previous, _ in rows if previous)
+        for previous, count in moved_from.items():
+            shift_counts([('group', previous)], -count)
+        if group_id:
+            shift_counts([('group', group_id)], len(rows))
+        scopes = {('all',)}
+        scopes.update(('group', previous) for previous in moved_from)
+        scopes.update(('author', author) for _, author in rows)
+        if group_id:
+            scopes.add(('group', group_id))
+        bump(scopes)
+        moved += len(rows)
+    return moved
+
+
+def delete_posts(queryset, size=BULK_BATCH_SIZE):
+    """Удаляет записи queryset вместе с комментариями и строками лент.
+
+    Возвращает число удалённых записей.
+    """
+    deleted = 0
+    for pks in chunks(queryset, size):
+        with transaction.atomic():
+            posts = list(Post.objects.filter(pk__in=pks).only(
+                'author_id', 'group_id', 'image'))
+            # _raw_delete - один DELETE без сбора объектов и сигналов,
+            # так Django сам удаляет строки без зависимостей
+            for model in (Comment, FeedEntry):
+                related = model.objects.filter(post_id__in=pks)
+                related._raw_delete(related.db)
+            rows = Post.objects.filter(pk__in=pks)
+            rows._raw_delete(rows.db)
+            authors = Counter(post.author_id for post in posts)
+            for author, count in authors.items():
+                AuthorStats.shift(author, 'posts_count', -count)
+            for name in {post.image.name for post in posts}:
+                release_image(name)
+        scopes = Counter(
+            scope for post in posts for scope in post_scopes(post))
+        for scope, count in scopes.items():
+            shift_counts([scope], -count)
+        for author in authors:
+            if not feeds.is_pulled(author):
+                forget_counts(feeds.follower_feeds(author))
+        bump(scopes)
+        deleted += len(posts)
+    return deleted
+
+
+def delete_comments(queryset, size=BULK_BATCH_SIZE):
+    """Удаляет комментарии queryset, пересчитывая счётчики записей.
+
+    Возвращает число удалённых комментариев.
+    """
+    deleted = 0
+    for pks in chunks(queryset, size):
+        with transaction.atomic():
+            comments = Comment.objects.filter(pk__in=pks)
+            post_ids = set(comments.values_list('post_id', flat=True))
+            comments._raw_delete(comments.db)
+            posts = Post.objects.filter(pk__in=post_ids)
+            # Пересчёт в том же UPDATE, а не сдвиг: параллельные
+            # комментарии не потеряются
+            posts.update(
+                comments_count=count_of(Comment, 'post'),
+                updated=timezone.now(),
+            )
+            scopes = {
+                scope for post in posts.only('author_id', 'group_id')
+                for scope in post_scopes(post)
+            }
+        bump(scopes)
+        deleted += len(pks)
+    return deleted
@@ -0,0 +1,71 @@
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+# Области подсчёта записей для пагинатора:
+# ('all',), ('group', id), ('author', id) и ('feed', id подписчика) -
+# записи, разложенные в его ленту (см. posts.feeds.follow_sources).
+COUNT_KEY = 'posts:count:{}'
+
+
+def count_key(scope):
+    return COUNT_KEY.format(':'.join(str(part) for part in scope))
+
+
+def estimate_count(queryset):
+    """Оценка числа строк по плану запроса, если СУБД её даёт."""
+    if connections[queryset.db].vendor != 'postgresql':
+        return None
+    plan = json.loads(queryset.order_by().explain(format='json'))
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def scope_count(queryset):
+    """Считает записи, не просматривая больше COUNT_EXACT_LIMIT строк."""
+    limit = settings.POSTS_COUNT_EXACT_LIMIT
+    count = queryset.order_by()[:limit].count()
+    if count < limit:
+        return count
+    # Большая область: точный COUNT(*) слишком дорог
+    return max(count, estimate_count(queryset) or 0)
+
+
+def cached_count(scope, *querysets):
+    """Возвращает число записей области из кэша, считая при промахе.
+
+    Область может складываться из нескольких непересекающихся выборок.
+    """
+    key = count_key(scope)
+    count = cache.get(key)
+    if count is None:
+        count = sum(scope_count(queryset) for queryset in querysets)
+        # add не затрёт значение, которое успел поправить сигнал
+        cache.add(key, count, settings.POSTS_COUNT_TIMEOUT)
+    return count
+
+
+def shift_counts(scopes, delta):
+    """Сдвигает закэшированные счётчики областей на delta."""
+    for scope in scopes:
+        try:
+            cache.incr(count_key(scope), delta)
+        except ValueError:
+            # Счётчика нет в кэше - посчитается при следующем запросе
+            pass
+
+
+def forget_counts(scopes):
+    cache.delete_many([count_key(scope) for scope in scopes])
+
+
+def count_of(model, field, outer='pk'):
+    """Подзапрос: число строк model, у которых field равно outer строки."""
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef(outer)}).order_by().values(
+            field).annotate(total=Count('pk')).values('total'),
+        output_field=models.IntegerField(),
+    ), 0)
@@ -0,0 +1,186 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.db.models import Count
+
+from .counts import forget_counts
+from .helper import FEED_KEYSET, KEYSET, FeedSource
+from .models import FeedEntry, Follow, Post
+
+# Сколько строк FeedEntry вставлять за один запрос
+FEED_BATCH_SIZE = 500
+PULLED_AUTHORS_KEY = 'posts:feed:pulled'
+
+_executor = None
+
+
+def executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='feeds')
+    return _executor
+
+
+def pulled_authors():
+    """Авторы, чьи записи лента подтягивает при чтении.
+
+    Это авторы с числом подписчиков не меньше FEED_PULL_THRESHOLD:
+    раскладывать их записи по лентам всех подписчиков слишком дорого.
+    """
+    threshold = settings.FEED_PULL_THRESHOLD
+    if threshold is None:
+        return frozenset()
+    authors = cache.get(PULLED_AUTHORS_KEY)
+    if authors is None:
+        authors = frozenset(
+            Follow.objects.values('author').annotate(
+                followers=Count('id'),
+            ).filter(
+                followers__gte=threshold,
+            ).values_list('author', flat=True)
+        )
+        cache.set(PULLED_AUTHORS_KEY, authors, None)
+    return authors
+
+
+def is_pulled(author_id):
+    return author_id in pulled_authors()
+
+
+def follower_count(author_id):
+    return Follow.objects.filter(author_id=author_id).count()
+
+
+def follower_feeds(author_id):
+    """Области счётчиков разложенных лент подписчиков автора."""
+    return [
+        ('feed', user_id) for user_id in Follow.objects.filter(
+            author_id=author_id).values_list('user_id', flat=True)
+    ]
+
+
+def follow(user_id, author_id):
+    """Обновляет ленту после подписки."""
+    if is_pulled(author_id):
+        return
+    threshold = settings.FEED_PULL_THRESHOLD
+    if threshold is not None and follower_count(author_id) >= threshold:
+        # Автор стал популярным: дальше его записи подтягиваются
+        # при чтении, старые разложенные строки лента пропускает
+        # и больше не считает
+        cache.delete(PULLED_AUTHORS_KEY)
+        forget_counts(follower_feeds(author_id))
+        return
+    backfill(user_id, author_id)
+
+
+def unfollow(user_id, author_id):
+    """Обновляет ленту после отписки."""
+    prune(user_id, author_id)
+    if not is_pulled(author_id):
+        return
+    if follower_count(author_id) >= settings.FEED_PULL_THRESHOLD:
+        return
+    # Автор опустился ниже порога. Дозаполнить ленты всех оставшихся
+    # подписчиков - порог на число записей автора строк, это делает
+    # пул, а не запрос отписки
+    transaction.on_commit(
+        lambda: executor().submit(push_author, author_id))
+
+
+def push_author(author_id):
+    """Снова раскладывает записи автора по лентам подписчиков."""
+    try:
+        # Сначала автор перестаёт подтягиваться: его новые записи
+        # раскладываются сами, а backfill без дублей доберёт старые
+        cache.delete(PULLED_AUTHORS_KEY)
+        followers = Follow.objects.filter(
+            author_id=author_id).values_list('user_id', flat=True)
+        for follower_id in followers.iterator():
+            backfill(follower_id, author_id)
+        forget_counts(follower_feeds(author_id))
+    finally:
+        # Поток пула живёт долго: соединение с базой не должно висеть
+        connections.close_all()
+
+
+def follow_sources(user):
+    """Источники ленты подписок пользователя.
+
+    Разложенные записи читаются из FeedEntry, записи каждого
+    популярного автора - прямо из Post по индексу (author, -pub_date).
+    Разложенные записи считаются в области ('feed', id), записи
+    популярного автора - в его области ('author', id): новая запись
+    сдвигает её и не трогает счётчики всех его подписчиков.
+    """
+    entries = FeedEntry.objects.filter(user=user).select_related(
+        'post__author', 'post__group')
+    pulled = pulled_authors()
+    if pulled:
+        pulled = list(Follow.objects.filter(
+            user=user, author_id__in=pulled,
+        ).values_list('author_id', flat=True))
+    if not pulled:
+        return [FeedSource(entries, FEED_KEYSET, 'post', ('feed', user.pk))]
+    # По источнику на автора: IN по нескольким авторам потребовал бы
+    # сортировки, а так каждый источник - проход по индексу
+    return [
+        FeedSource(
+            entries.exclude(author_id__in=pulled), FEED_KEYSET, 'post',
+            ('feed', user.pk),
+        )
+    ] + [
+        FeedSource(
+            Post.objects.feed().filter(author_id=author_id), KEYSET, None,
+            ('author', author_id),
+        )
+        for author_id in pulled
+    ]
+
+
+def fan_out(post):
+    """Раскладывает новую запись в ленты подписчиков автора."""
+    if is_pulled(post.author_id):
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id).values_list('user_id', flat=True)
+    FeedEntry.objects.bulk_create(
+        (
+            FeedEntry(
+                user_id=user_id,
+                post=post,
+                author_id=post.author_id,
+                pub_date=post.pub_date,
+            )
+            for user_id in followers.iterator()
+        ),
+        batch_size=FEED_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту подписчика все записи автора."""
+    posts = Post.objects.filter(
+        author_id=author_id).values_list('id', 'pub_date')
+    FeedEntry.objects.bulk_create(
+        (
+            FeedEntry(
+                user_id=user_id,
+                post_id=post_id,
+                author_id=author_id,
+                pub_date=pub_date,
+            )
+            for post_id, pub_date in posts.iterator()
+        ),
+        batch_size=FEED_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def prune(user_id, author_id):
+    """Убирает из ленты подписчика записи автора."""
+    FeedEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
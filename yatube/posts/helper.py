@@ -1,9 +1,293 @@
-from django.core.paginator import Paginator
+import base64
+import binascii
+import heapq
+import json
+from collections import namedtuple
+from itertools import islice
+
+from django.core.paginator import Page, Paginator
 from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+from .counts import cached_count, scope_count
+
+# Ключ сортировки ленты: от новых записей к старым,
+# id разрешает совпадения pub_date.
+KEYSET = ('pub_date', 'id')
+# Тот же ключ для ленты подписок, собранной в FeedEntry
+FEED_KEYSET = ('pub_date', 'post_id')
+CURSOR_PARAM = 'cursor'
+
+# Источник ленты для MergedCursorPaginator: выборка, её ключ сортировки,
+# связь, через которую строка выборки ведёт к записи (None - сама запись),
+# и область счётчика выборки в posts.counts (None - COUNT(*))
+FeedSource = namedtuple(
+    'FeedSource', ['queryset', 'keys', 'related', 'scope'],
+    defaults=(None,),
+)
+
+
+def encode_token(data):
+    """Упаковывает данные, сериализуемые в JSON, в непрозрачный токен."""
+    raw = json.dumps(data)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_token(token):
+    """Распаковывает токен encode_token; испорченный токен даёт None."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        return json.loads(raw.decode())
+    except (binascii.Error, ValueError):
+        return None
+
+
+def encode_cursor(values, number, backwards=False):
+    """Упаковывает позицию в ленте в непрозрачный токен для URL."""
+    if values is not None:
+        values = [values[0].isoformat(), values[1]]
+    return encode_token({'v': values, 'n': number, 'b': backwards})
+
+
+def decode_cursor(token):
+    """Распаковывает токен; для испорченного токена возвращает None."""
+    try:
+        data = decode_token(token)
+        values, backwards = data['v'], bool(data['b'])
+        if values is None and not backwards:
+            # Позицию без ключа сервер выдаёт только для last_cursor
+            return None
+        if values is not None:
+            pub_date = parse_datetime(values[0])
+            if pub_date is None:
+                return None
+            values = (pub_date, int(values[1]))
+        return values, int(data['n']), backwards
+    except (ValueError, TypeError, KeyError, IndexError):
+        return None
+
+
+class CursorPaginator(Paginator):
+    """Пагинатор по ключу (pub_date, id) без OFFSET.
+
+    Соседние страницы выбираются условием по ключу последней
+    (первой) записи текущей страницы, поэтому глубокая страница
+    стоит столько же, сколько первая. Переход по номеру страницы
+    остаётся запасным вариантом и работает через OFFSET.
+    Если передана область scope, число записей берётся из кэша
+    счётчиков posts.counts, а не из COUNT(*) на каждый запрос.
+    """
+
+    def __init__(self, object_list, per_page, keys=KEYSET, scope=None,
+                 **kwargs):
+        self.keys = keys
+        self.scope = scope
+        if hasattr(object_list, 'order_by'):
+            object_list = object_list.order_by(
+                *('-' + key for key in keys))
+        super().__init__(object_list, per_page, **kwargs)
+
+    @cached_property
+    def count(self):
+        if self.scope is None:
+            return super().count
+        return cached_count(self.scope, self.object_list)
+
+    def _get_page(self, object_list, number, paginator):
+        page = Page(list(object_list), number, paginator)
+        # Курсоры соседних страниц строятся по крайним записям
+        if page.object_list:
+            page.next_cursor = encode_cursor(
+                self._keys(page.object_list[-1]), number + 1)
+            page.previous_cursor = encode_cursor(
+                self._keys(page.object_list[0]), number - 1, backwards=True)
+        else:
+            page.next_cursor = page.previous_cursor = ''
+        return page
+
+    def _keys(self, obj):
+        return tuple(getattr(obj, key) for key in self.keys)
+
+    @property
+    def last_cursor(self):
+        return encode_cursor(None, self.num_pages, backwards=True)
+
+    def _number(self, number, has_previous, has_next):
+        # Номер из токена лишь подсказка: согласуем его с count,
+        # чтобы has_previous/has_next страницы совпали с выборкой.
+        if not has_previous:
+            return 1
+        if not has_next:
+            return max(self.num_pages, 2)
+        return max(min(number, self.num_pages - 1), 2)
+
+    def _seek(self, values, backwards):
+        first, second = self.keys
+        if backwards:
+            queryset = self.object_list.reverse()
+            if values is None:
+                return queryset
+            return queryset.filter(
+                Q(**{first + '__gte': values[0]}),
+                Q(**{first + '__gt': values[0]})
+                | Q(**{second + '__gt': values[1]}),
+            )
+        # Условие first <= x вынесено отдельно, чтобы работал индекс
+        return self.object_list.filter(
+            Q(**{first + '__lte': values[0]}),
+            Q(**{first + '__lt': values[0]})
+            | Q(**{second + '__lt': values[1]}),
+        )
+
+    def _fetch(self, values, backwards, limit):
+        return list(self._seek(values, backwards)[:limit])
 
+    def cursor_page(self, token):
+        """Возвращает страницу по токену курсора."""
+        cursor = decode_cursor(token)
+        if cursor is None:
+            return self.get_page(1)
+        values, number, backwards = cursor
+        # Лишняя запись показывает, есть ли страница дальше
+        rows = self._fetch(values, backwards, self.per_page + 1)
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if not backwards:
+            return self._get_page(
+                rows, self._number(number, True, has_more), self)
+        if not has_more and values is not None:
+            # Дошли до начала ленты
+            return self.page(1)
+        rows.reverse()
+        return self._get_page(
+            rows, self._number(number, has_more, values is not None), self)
 
-def paginator(request, posts):
-    paginator = Paginator(posts, settings.POSTS_LIMIT)
+
+class MergedCursorPaginator(CursorPaginator):
+    """Лента, слитая из нескольких источников по ключу (pub_date, id).
+
+    Каждый источник читается своим курсором не дальше одной страницы,
+    результаты сливаются с сохранением порядка -pub_date. Число записей -
+    сумма счётчиков источников: у каждого своя область, и её сбрасывают
+    правки только этого источника.
+    """
+
+    def __init__(self, sources, per_page, **kwargs):
+        self.sources = [
+            (CursorPaginator(queryset, per_page, keys, scope), related)
+            for queryset, keys, related, scope in sources
+        ]
+        super().__init__([], per_page, **kwargs)
+
+    @cached_property
+    def count(self):
+        return sum(source.count for source, _ in self.sources)
+
+    def _merge(self, rows_by_source, backwards, limit):
+        streams = [
+            [getattr(row, related) if related else row for row in rows]
+            for (_, related), rows in zip(self.sources, rows_by_source)
+        ]
+        merged = heapq.merge(*streams, key=self._keys, reverse=not backwards)
+        return list(islice(merged, limit))
+
+    def _fetch(self, values, backwards, limit):
+        return self._merge(
+            [
+                source._seek(values, backwards)[:limit]
+                for source, _ in self.sources
+            ],
+            backwards,
+            limit,
+        )
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        top = bottom + self.per_page
+        rows = self._merge(
+            [source.object_list[:top] for source, _ in self.sources],
+            False,
+            top,
+        )
+        return self._get_page(rows[bottom:top], number, self)
+
+
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор админки без COUNT(*) по всей таблице.
+
+    Выборка считается не дальше POSTS_COUNT_EXACT_LIMIT строк
+    (см. posts.counts.scope_count), а без фильтров, если задана
+    область scope, - берётся из кэша её счётчика.
+    """
+    scope = None
+
+    @cached_property
+    def count(self):
+        # values('pk') отбрасывает аннотации: их подзапросы нужны
+        # только строкам страницы
+        queryset = self.object_list.values('pk')
+        if self.scope is not None and not queryset.query.where:
+            return cached_count(self.scope, queryset)
+        return scope_count(queryset)
+
+
+class AllPostsPaginator(EstimatedCountPaginator):
+    scope = ('all',)
+
+
+def chunks(queryset, size):
+    """Списки pk queryset порциями по возрастанию pk."""
+    last = None
+    while True:
+        page = queryset.order_by('pk')
+        if last is not None:
+            page = page.filter(pk__gt=last)
+        pks = list(page.values_list('pk', flat=True)[:size])
+        if not pks:
+            return
+        yield pks
+        last = pks[-1]
+
+
+def elided_page_range(number, num_pages, on_each_side=2, on_ends=1):
+    """Номера страниц вокруг текущей и по краям, пропуски - None.
+
+    Длина результата не зависит от числа страниц.
+    """
+    if num_pages <= (on_each_side + on_ends) * 2 + 1:
+        yield from range(1, num_pages + 1)
+        return
+    if number > 1 + on_each_side + on_ends + 1:
+        yield from range(1, on_ends + 1)
+        yield None
+        yield from range(number - on_each_side, number + 1)
+    else:
+        yield from range(1, number + 1)
+    if number < num_pages - on_each_side - on_ends - 1:
+        yield from range(number + 1, number + on_each_side + 1)
+        yield None
+        yield from range(num_pages - on_ends + 1, num_pages + 1)
+    else:
+        yield from range(number + 1, num_pages + 1)
+
+
+def paginator(request, posts, scope=None, keys=KEYSET):
+    paginator = CursorPaginator(
+        posts, settings.POSTS_LIMIT, keys=keys, scope=scope)
+    cursor = request.GET.get(CURSOR_PARAM)
+    if cursor:
+        return paginator.cursor_page(cursor)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
     return page_obj
+
+
+def merged_paginator(request, sources):
+    paginator = MergedCursorPaginator(sources, settings.POSTS_LIMIT)
+    cursor = request.GET.get(CURSOR_PARAM)
+    if cursor:
+        return paginator.cursor_page(cursor)
+    return paginator.get_page(request.GET.get('page'))
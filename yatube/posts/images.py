@@ -0,0 +1,100 @@
+import base64
+import io
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+# Форматы, которые перекодируются при загрузке. Остальные
+# (и анимации) сохраняются как есть, записываются только размеры
+INGEST_FORMATS = ('JPEG', 'PNG', 'WEBP', 'GIF')
+
+
+def save_options(image_format):
+    if image_format in ('JPEG', 'WEBP'):
+        options = {'quality': settings.POSTS_IMAGE_QUALITY}
+        if image_format == 'JPEG':
+            options.update(optimize=True, progressive=True)
+        return options
+    return {'optimize': True}
+
+
+def placeholder(image):
+    """Крошечная размытая копия картинки как data URI.
+
+    Показывается фоном, пока грузится сама картинка.
+    """
+    image = image.convert('RGB')
+    image.thumbnail(settings.POSTS_IMAGE_PLACEHOLDER_SIZE, Image.BILINEAR)
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=50)
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    return f'data:image/jpeg;base64,{encoded}'
+
+
+def metadata(image, size):
+    """Значения полей Post, описывающих картинку."""
+    width, height = image.size
+    return {
+        'image_width': width,
+        'image_height': height,
+        'image_bytes': size,
+        'image_placeholder': placeholder(image),
+    }
+
+
+def describe(file):
+    """Поля Post для уже сохранённой картинки, без перекодировки."""
+    file.seek(0)
+    try:
+        with Image.open(file) as image:
+            return metadata(ImageOps.exif_transpose(image), file.size)
+    except (OSError, Image.DecompressionBombError):
+        return {
+            'image_width': None,
+            'image_height': None,
+            'image_bytes': file.size,
+            'image_placeholder': '',
+        }
+
+
+def ingest(upload):
+    """Готовит загруженную картинку к хранению.
+
+    Поворачивает по EXIF, уменьшает до POSTS_IMAGE_MAX_SIZE, перекодирует
+    с качеством POSTS_IMAGE_QUALITY без метаданных (кроме цветового
+    профиля). Возвращает (файл, поля Post из metadata); файл - None,
+    если оригинал лучше оставить как есть.
+    """
+    upload.seek(0)
+    try:
+        image = Image.open(upload)
+    except (OSError, Image.DecompressionBombError):
+        # Не картинка: форма такое не пропустит, но ORM может
+        return None, describe(upload)
+    with image:
+        image_format = image.format
+        if (image_format not in INGEST_FORMATS
+                or getattr(image, 'is_animated', False)):
+            return None, metadata(image, upload.size)
+        icc_profile = image.info.get('icc_profile')
+        changed = bool(image.getexif())
+        image = ImageOps.exif_transpose(image)
+        size = image.size
+        image.thumbnail(settings.POSTS_IMAGE_MAX_SIZE, Image.LANCZOS)
+        changed = changed or image.size != size
+        if image_format == 'JPEG' and image.mode not in ('L', 'RGB', 'CMYK'):
+            image = image.convert('RGB')
+        buffer = io.BytesIO()
+        options = save_options(image_format)
+        if icc_profile:
+            options['icc_profile'] = icc_profile
+        image.save(buffer, image_format, **options)
+        # Без уменьшения и метаданных перекодировка может только
+        # раздуть файл
+        if not changed and buffer.tell() >= upload.size:
+            return None, metadata(image, upload.size)
+        content = ContentFile(
+            buffer.getvalue(), name=os.path.basename(upload.name))
+        return content, metadata(image, content.size)
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from posts.helper import chunks
+from posts.images import describe
+from posts.models import Post
+from posts.signals import post_scopes
+from posts.versions import bump
+
+BACKFILL_BATCH_SIZE = 100
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет размеры, объём и заглушку картинок у записей, '
+        'загруженных до появления этих полей.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только посчитать записи без заглушки.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BACKFILL_BATCH_SIZE,
+        )
+
+    def handle(self, *args, **options):
+        queryset = Post.objects.exclude(image='').filter(image_placeholder='')
+        if options['dry_run']:
+            self.stdout.write(
+                f'Записей без заглушки: {queryset.count()} (без изменений)')
+            return
+        storage = Post._meta.get_field('image').storage
+        filled = missing = 0
+        for pks in chunks(queryset, options['batch_size']):
+            scopes = set()
+            for post in Post.objects.filter(pk__in=pks).only(
+                    'image', 'author_id', 'group_id'):
+                try:
+                    with storage.open(post.image.name) as file:
+                        fields = describe(file)
+                except FileNotFoundError:
+                    missing += 1
+                    self.stderr.write(f'Нет файла {post.image.name}')
+                    continue
+                # update, а не save: ни сигналов, ни перекодировки;
+                # новое updated сменит ключ закэшированной карточки
+                Post.objects.filter(pk=post.pk).update(
+                    updated=timezone.now(), **fields)
+                scopes.update(post_scopes(post))
+                filled += 1
+            bump(scopes)
+        self.stdout.write(
+            f'Заполнено записей: {filled}, без файла: {missing}')
@@ -0,0 +1,110 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts import thumbnails
+from posts.models import Post
+
+BACKFILL_BATCH_SIZE = 200
+
+
+def init_worker():
+    # При spawn процесс пула начинает с чистого интерпретатора,
+    # при fork - с копией соединений родителя, которые трогать нельзя
+    django.setup()
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = (
+        'Создаёт миниатюры всех размеров для картинок уже '
+        'опубликованных записей в пуле процессов. Прерванный проход '
+        'продолжается с сохранённой точки.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count(),
+            help='Процессов в пуле; 0 - создавать в этом процессе.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BACKFILL_BATCH_SIZE,
+        )
+        parser.add_argument(
+            '--checkpoint',
+            default=os.path.join(settings.BASE_DIR, 'thumbnails.checkpoint'),
+            help='Файл, где хранится pk последней обработанной записи.',
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Начать с первой записи, не глядя на точку.',
+        )
+
+    def handle(self, *args, **options):
+        self.checkpoint = options['checkpoint']
+        last = None if options['restart'] else self.load_checkpoint()
+        if last is not None:
+            self.stdout.write(f'Продолжаем после записи {last}')
+        queryset = Post.objects.exclude(image='').order_by('pk')
+        started = time.monotonic()
+        done = failed = 0
+        executor = None
+        if options['workers']:
+            # Процессы не должны делить соединение с базой родителя
+            connections.close_all()
+            executor = ProcessPoolExecutor(
+                options['workers'], initializer=init_worker)
+        try:
+            while True:
+                page = queryset
+                if last is not None:
+                    page = page.filter(pk__gt=last)
+                rows = list(page.values_list(
+                    'pk', 'image')[:options['batch_size']])
+                if not rows:
+                    break
+                # Одинаковые загрузки хранятся одним файлом
+                names = list(dict.fromkeys(name for _, name in rows))
+                if executor is None:
+                    results = map(thumbnails.generate, names)
+                else:
+                    results = executor.map(thumbnails.generate, names)
+                for result in results:
+                    done += 1
+                    failed += not result
+                last = rows[-1][0]
+                self.save_checkpoint(last)
+                rate = done / max(time.monotonic() - started, 1e-6)
+                self.stdout.write(
+                    f'До записи {last}: картинок {done}, ошибок {failed}, '
+                    f'{rate:.1f} в секунду'
+                )
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        self.stdout.write(f'Готово: картинок {done}, ошибок {failed}')
+
+    def load_checkpoint(self):
+        try:
+            with open(self.checkpoint) as file:
+                return json.load(file)['last_pk']
+        except FileNotFoundError:
+            return None
+
+    def save_checkpoint(self, last):
+        # Через временный файл: прерывание не оставит точку битой
+        temporary = f'{self.checkpoint}.tmp'
+        with open(temporary, 'w') as file:
+            json.dump({'last_pk': last}, file)
+        os.replace(temporary, self.checkpoint)
@@ -0,0 +1,112 @@
+import statistics
+import tempfile
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory, override_settings
+from django.urls import reverse
+
+from core.runner import isolated_settings
+from posts import feeds
+from posts.models import FeedEntry, Follow, Post
+from posts.views import follow_index
+
+User = get_user_model()
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает раскладку ленты при записи и гибридную ленту: '
+        'сколько строк пишет одна публикация и сколько длится чтение. '
+        'Работает на отдельной тестовой базе и своём файле кэша, '
+        'рабочие база и кэш не затрагиваются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--followers', type=int, default=2000)
+        parser.add_argument('--posts', type=int, default=20)
+        parser.add_argument('--reads', type=int, default=100)
+
+    def handle(self, *args, **options):
+        # Тысячи пользователей и подписок нельзя создавать в рабочей
+        # базе, а cache.clear() - звать на общем кэше хоста: команда
+        # поднимает тестовую базу, как manage.py test, и кэш в своём
+        # временном файле
+        with tempfile.TemporaryDirectory() as directory, \
+                isolated_settings(directory):
+            old_name = connection.creation.create_test_db(
+                verbosity=0, autoclobber=True, serialize=False)
+            try:
+                results = self.run_strategies(options)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+        self.stdout.write(
+            f'{"strategy":<8} {"rows/post":>10} {"write ms":>10} '
+            f'{"read p50 ms":>12} {"read p95 ms":>12}'
+        )
+        for strategy, (rows, write, reads) in results:
+            self.stdout.write(
+                f'{strategy:<8} {rows:>10.0f} {write:>10.2f} '
+                f'{statistics.median(reads):>12.2f} '
+                f'{statistics.quantiles(reads, n=20)[-1]:>12.2f}'
+            )
+
+    def run_strategies(self, options):
+        results = []
+        # В гибридной ленте популярен только автор, на которого
+        # подписаны все; второго автора читает половина подписчиков
+        strategies = (('push', None), ('hybrid', options['followers']))
+        for strategy, threshold in strategies:
+            # Откат возвращает тестовую базу к пустой для следующей
+            # раскладки; других пишущих в неё нет
+            try:
+                with transaction.atomic():
+                    results.append(
+                        (strategy, self.measure(threshold, **options)))
+                    raise Rollback
+            except Rollback:
+                pass
+            finally:
+                cache.clear()
+        return results
+
+    def measure(self, threshold, followers, posts, reads, **options):
+        celebrity = User.objects.create_user(username='bench_celebrity')
+        regular = User.objects.create_user(username='bench_regular')
+        User.objects.bulk_create(
+            User(username=f'bench_follower_{number}')
+            for number in range(followers)
+        )
+        readers = list(User.objects.filter(
+            username__startswith='bench_follower_'))
+        with override_settings(FEED_PULL_THRESHOLD=threshold):
+            cache.delete(feeds.PULLED_AUTHORS_KEY)
+            for number, reader in enumerate(readers):
+                Follow.objects.create(user=reader, author=celebrity)
+                if number % 2 == 0:
+                    Follow.objects.create(user=reader, author=regular)
+            for number in range(posts):
+                Post.objects.create(text=f'Regular {number}', author=regular)
+            entries = FeedEntry.objects.count()
+            started = time.perf_counter()
+            for number in range(posts):
+                Post.objects.create(
+                    text=f'Celebrity {number}', author=celebrity)
+            write = (time.perf_counter() - started) * 1000 / posts
+            rows = (FeedEntry.objects.count() - entries) / posts
+            factory = RequestFactory()
+            latencies = []
+            for number in range(reads):
+                request = factory.get(reverse('posts:follow_index'))
+                request.user = readers[2 * number % len(readers)]
+                started = time.perf_counter()
+                follow_index(request)
+                latencies.append((time.perf_counter() - started) * 1000)
+        return rows, write, latencies
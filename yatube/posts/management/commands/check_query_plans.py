@@ -0,0 +1,74 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from posts.helper import FEED_KEYSET, CursorPaginator
+from posts.models import Comment, FeedEntry, Follow, Post
+
+# Полный просмотр таблицы (SCAN без USING INDEX) и сортировка во
+# временном B-дереве означают, что запрос растёт вместе с таблицей
+BAD_PLAN = re.compile(
+    r'(\bSCAN (TABLE )?\w+( AS \w+)?$)|(USE TEMP B-TREE)')
+
+
+def feed_queries():
+    """Запросы лент в том виде, в каком их строят представления."""
+    limit = 10
+    cursor = (timezone.now(), 1)
+    areas = {
+        'index': Post.objects.feed(),
+        'group': Post.objects.feed().filter(group_id=1),
+        'profile': Post.objects.feed().filter(author_id=1),
+    }
+    for name, queryset in areas.items():
+        pager = CursorPaginator(queryset, limit)
+        yield f'{name} page', pager.object_list[:limit]
+        yield f'{name} next', pager._seek(cursor, False)[:limit + 1]
+        yield f'{name} previous', pager._seek(cursor, True)[:limit + 1]
+        yield f'{name} last', pager._seek(None, True)[:limit + 1]
+    entries = CursorPaginator(
+        FeedEntry.objects.filter(user_id=1).select_related(
+            'post__author', 'post__group'),
+        limit,
+        FEED_KEYSET,
+    )
+    yield 'follow page', entries.object_list[:limit]
+    yield 'follow next', entries._seek(cursor, False)[:limit + 1]
+    yield 'follow previous', entries._seek(cursor, True)[:limit + 1]
+    yield 'post comments', Comment.objects.filter(
+        post_id=1).order_by('created')
+    yield 'author followers', Follow.objects.filter(
+        author_id=1).values_list('user_id', flat=True)
+    yield 'unfollow prune', FeedEntry.objects.filter(
+        user_id=1, author_id=1)
+
+
+class Command(BaseCommand):
+    help = (
+        'Выполняет EXPLAIN QUERY PLAN для запросов лент и завершается '
+        'ошибкой, если какой-то из них просматривает таблицу целиком '
+        'или сортирует во временном B-дереве.'
+    )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Команда разбирает только планы SQLite.')
+        failed = []
+        for name, queryset in feed_queries():
+            plan = queryset.explain()
+            bad = [
+                line for line in plan.splitlines()
+                if BAD_PLAN.search(line.strip())
+            ]
+            status = 'FAIL' if bad else 'ok'
+            self.stdout.write(f'{status:<4} {name}')
+            if options['verbosity'] > 1 or bad:
+                for line in plan.splitlines():
+                    self.stdout.write(f'       {line}')
+            if bad:
+                failed.append(name)
+        if failed:
+            raise CommandError(
+                'Запросы без подходящего индекса: ' + ', '.join(failed))
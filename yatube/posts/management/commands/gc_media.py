@@ -0,0 +1,175 @@
+import os
+from datetime import timedelta
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from sorl.thumbnail import default, delete as sorl_delete
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from posts.models import Post
+from posts.thumbnails import kvstore_get_many
+
+# Сколько имён сверять с базой за один запрос
+GC_BATCH_SIZE = 500
+# Файлы моложе этого (в секундах) не трогаются: запись или
+# миниатюра под ними может быть ещё не сохранена
+GC_MIN_AGE = 60 * 60
+
+
+def walk(storage, directory):
+    """Имена файлов хранилища под directory, каталог за каталогом."""
+    if not storage.exists(directory):
+        return
+    directories, files = storage.listdir(directory)
+    for filename in files:
+        yield os.path.join(directory, filename)
+    for name in directories:
+        yield from walk(storage, os.path.join(directory, name))
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def kvstore_keys(prefix, size):
+    """Ключи хранилища sorl с префиксом prefix порциями по size."""
+    last = None
+    while True:
+        page = KVStoreModel.objects.filter(
+            key__startswith=prefix).order_by('key')
+        if last is not None:
+            page = page.filter(key__gt=last)
+        keys = list(page.values_list('key', flat=True)[:size])
+        if not keys:
+            return
+        yield keys
+        last = keys[-1]
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет картинки, на которые не ссылается ни одна запись, '
+        'и миниатюры, которых нет в хранилище sorl.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать, что будет удалено.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=GC_BATCH_SIZE,
+        )
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=GC_MIN_AGE,
+            help='Не трогать файлы моложе стольких секунд.',
+        )
+
+    def handle(self, *args, **options):
+        self.dry_run = options['dry_run']
+        self.verbosity = options['verbosity']
+        self.size = options['batch_size']
+        self.cutoff = timezone.now() - timedelta(seconds=options['min_age'])
+        field = Post._meta.get_field('image')
+        self.storage = field.storage
+        self.upload_to = field.upload_to
+        sources = self.collect_sources()
+        originals, originals_bytes = self.collect_originals()
+        thumbnails, thumbnails_bytes = self.collect_thumbnails()
+        self.stdout.write(
+            f'Исходников в хранилище sorl: {sources}, '
+            f'картинок: {originals} ({originals_bytes} байт), '
+            f'миниатюр: {thumbnails} ({thumbnails_bytes} байт)'
+            + (' (без изменений)' if self.dry_run else '')
+        )
+
+    def is_old(self, storage, name):
+        try:
+            return storage.get_modified_time(name) < self.cutoff
+        except FileNotFoundError:
+            return True
+
+    def unused(self, names):
+        """Имена картинок, на которые не ссылается ни одна запись."""
+        used = set(Post.objects.filter(
+            image__in=names).values_list('image', flat=True))
+        return [name for name in names if name not in used]
+
+    def collect_sources(self):
+        """Исходники, чьи миниатюры записаны в sorl, а записей уже нет.
+
+        Удаляются вместе с миниатюрами и ключами; так находятся
+        и миниатюры картинок, удалённых мимо сигналов.
+        """
+        found = 0
+        prefix = add_prefix('', 'thumbnails')
+        for keys in kvstore_keys(prefix, self.size):
+            sources = {}
+            for key in keys:
+                source = default.kvstore._get(key[len(prefix):])
+                if source and source.name.startswith(self.upload_to):
+                    sources[source.name] = source
+            for name in self.unused(list(sources)):
+                if not self.is_old(self.storage, name):
+                    continue
+                found += 1
+                self.report(name)
+                if not self.dry_run:
+                    sorl_delete(sources[name])
+        return found
+
+    def collect_originals(self):
+        """Файлы под upload_to без записей."""
+        found = size = 0
+        for names in batches(
+                walk(self.storage, self.upload_to), self.size):
+            for name in self.unused(names):
+                # Возраст проверяется последним: ContentHashStorage
+                # обновляет время файла, который загрузили повторно
+                if not self.is_old(self.storage, name):
+                    continue
+                found += 1
+                size += self.storage.size(name)
+                self.report(name)
+                if not self.dry_run:
+                    sorl_delete(ImageFile(name, self.storage))
+        return found, size
+
+    def collect_thumbnails(self):
+        """Файлы миниатюр, которых не знает хранилище sorl."""
+        found = size = 0
+        storage = default.storage
+        for names in batches(
+                walk(storage, sorl_settings.THUMBNAIL_PREFIX), self.size):
+            keys = {
+                add_prefix(ImageFile(name, storage).key): name
+                for name in names
+            }
+            known = kvstore_get_many(list(keys))
+            for key, name in keys.items():
+                if key in known or not self.is_old(storage, name):
+                    continue
+                found += 1
+                size += storage.size(name)
+                self.report(name)
+                if not self.dry_run:
+                    storage.delete(name)
+        return found, size
+
+    def report(self, name):
+        if self.verbosity > 1:
+            self.stdout.write(name)
@@ -0,0 +1,32 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+
+from posts import feeds
+from posts.counts import forget_counts
+from posts.models import Follow
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересобирает ленты подписок: дозаполняет FeedEntry для обычных '
+        'авторов и убирает разложенные записи популярных.'
+    )
+
+    def handle(self, *args, **options):
+        cache.delete(feeds.PULLED_AUTHORS_KEY)
+        pulled = feeds.pulled_authors()
+        follows = Follow.objects.values_list('user_id', 'author_id')
+        total = 0
+        users = set()
+        for user_id, author_id in follows.iterator():
+            if author_id in pulled:
+                feeds.prune(user_id, author_id)
+            else:
+                feeds.backfill(user_id, author_id)
+            users.add(user_id)
+            total += 1
+        forget_counts([('feed', user_id) for user_id in users])
+        self.stdout.write(
+            f'Подписок обработано: {total}, '
+            f'популярных авторов: {len(pulled)}'
+        )
@@ -0,0 +1,78 @@
+from django.core.management.base import BaseCommand
+
+from posts.counts import count_of
+from posts.helper import chunks
+from posts.models import AuthorStats, Comment, Follow, Post, User
+
+# Сколько строк сверять за один проход
+RECONCILE_BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверяет денормализованные счётчики записей, комментариев и '
+        'подписчиков с данными и исправляет расхождения.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать расхождения, ничего не меняя.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=RECONCILE_BATCH_SIZE,
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        self.verbosity = options['verbosity']
+        size = options['batch_size']
+        created = drifted = 0
+        stats_counts = {
+            'posts_count': count_of(Post, 'author'),
+            'followers_count': count_of(Follow, 'author'),
+            'following_count': count_of(Follow, 'user'),
+        }
+        for pks in chunks(User.objects.all(), size):
+            missing = set(pks) - set(AuthorStats.objects.filter(
+                pk__in=pks).values_list('pk', flat=True))
+            created += len(missing)
+            if missing and not dry_run:
+                AuthorStats.objects.bulk_create(
+                    [AuthorStats(user_id=pk) for pk in missing],
+                    ignore_conflicts=True,
+                )
+            drifted += self.reconcile(
+                AuthorStats.objects.filter(pk__in=pks), stats_counts,
+                dry_run)
+        for pks in chunks(Post.objects.all(), size):
+            drifted += self.reconcile(
+                Post.objects.filter(pk__in=pks),
+                {'comments_count': count_of(Comment, 'post')},
+                dry_run)
+        self.stdout.write(
+            f'Создано строк счётчиков: {created}, '
+            f'строк с расхождениями: {drifted}'
+            + (' (без изменений)' if dry_run else '')
+        )
+
+    def reconcile(self, queryset, counts, dry_run):
+        """Исправляет строки queryset, где счётчики разошлись с данными."""
+        actual = {f'actual_{field}': value for field, value in counts.items()}
+        rows = queryset.annotate(**actual).values(
+            'pk', *counts, *actual)
+        bad = [
+            row['pk'] for row in rows
+            if any(row[field] != row[f'actual_{field}'] for field in counts)
+        ]
+        if bad and not dry_run:
+            # Значения считаются в том же UPDATE, поэтому параллельные
+            # F()-сдвиги из сигналов не теряются
+            queryset.filter(pk__in=bad).update(**counts)
+        if self.verbosity > 1:
+            for pk in bad:
+                self.stdout.write(f'{queryset.model.__name__} {pk}')
+        return len(bad)
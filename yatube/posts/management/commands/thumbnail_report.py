@@ -0,0 +1,74 @@
+import io
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image, ImageOps
+from sorl.thumbnail.conf import settings as sorl_settings
+
+from posts.thumbnails import variants
+
+
+def encoded_size(image, geometry, image_format):
+    """Размер миниатюры в байтах: обрезка по центру, как crop='center'."""
+    width, height = (int(side) for side in geometry.split('x'))
+    thumbnail = ImageOps.fit(
+        image, (width, height), method=Image.LANCZOS, centering=(0.5, 0.5))
+    buffer = io.BytesIO()
+    thumbnail.save(
+        buffer, image_format, quality=sorl_settings.THUMBNAIL_QUALITY)
+    return buffer.tell()
+
+
+def image_paths(root):
+    """Файлы под root, включая подкаталоги хранилища по хэшу."""
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            yield os.path.join(directory, filename)
+
+
+class Command(BaseCommand):
+    help = (
+        'Считает, сколько байт экономят варианты миниатюр по ширинам '
+        'и форматам по сравнению с одной JPEG-миниатюрой, на картинках '
+        'из media/posts.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path', default=os.path.join(settings.MEDIA_ROOT, 'posts'))
+        parser.add_argument('--limit', type=int, default=50)
+        parser.add_argument('--name', default='card')
+
+    def handle(self, *args, **options):
+        baseline_geometry, _ = settings.POSTS_THUMBNAILS[options['name']]
+        thumbnail_variants = list(variants(options['name']))
+        baseline = 0
+        totals = {(width, image_format): 0
+                  for width, image_format, _, _ in thumbnail_variants}
+        images = 0
+        for path in sorted(image_paths(options['path'])):
+            if images >= options['limit']:
+                break
+            try:
+                with Image.open(path) as image:
+                    image = image.convert('RGB')
+            except (OSError, ValueError):
+                continue
+            images += 1
+            baseline += encoded_size(image, baseline_geometry, 'JPEG')
+            for width, image_format, geometry, _ in thumbnail_variants:
+                totals[width, image_format] += encoded_size(
+                    image, geometry, image_format)
+        if not images:
+            raise CommandError(f'В {options["path"]} нет картинок')
+        self.stdout.write(
+            f'Картинок: {images}, одна JPEG {baseline_geometry}: '
+            f'{baseline} байт')
+        self.stdout.write(
+            f'{"width":>6} {"format":<6} {"bytes":>10} {"saved":>7}')
+        for (width, image_format), total in totals.items():
+            self.stdout.write(
+                f'{width:>6} {image_format:<6} {total:>10} '
+                f'{1 - total / baseline:>7.1%}'
+            )
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.16 on 2026-10-18 03:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_content_hash_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='image_placeholder',
+            field=models.TextField(blank=True, editable=False, help_text='data URI размытой копии, пока грузится картинка', verbose_name='Заглушка картинки'),
+        ),
+    ]
@@ -0,0 +1,95 @@
+from django.db import migrations
+
+
+def without_yo(column):
+    return f"replace(replace({column}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+# Полнотекстовый индекс записей и комментариев, см. posts.search.
+# rowid записи - 2 * id, комментария - 2 * id + 1. unicode61
+# не считает «ё» и «е» одной буквой, поэтому «ё» заменяется
+# и в индексе, и в запросе
+SEARCH_SQL_TEMPLATES = [
+    """
+    CREATE VIRTUAL TABLE posts_search USING fts5(
+        body, post_id UNINDEXED,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER posts_search_post_insert AFTER INSERT ON posts_post
+    BEGIN
+        INSERT INTO posts_search (rowid, body, post_id)
+        VALUES (new.id * 2, {body}, new.id);
+    END
+    """,
+    """
+    CREATE TRIGGER posts_search_post_update
+    AFTER UPDATE OF text ON posts_post
+    BEGIN
+        UPDATE posts_search SET body = {body} WHERE rowid = new.id * 2;
+    END
+    """,
+    """
+    CREATE TRIGGER posts_search_post_delete AFTER DELETE ON posts_post
+    BEGIN
+        DELETE FROM posts_search WHERE rowid = old.id * 2;
+    END
+    """,
+    """
+    CREATE TRIGGER posts_search_comment_insert
+    AFTER INSERT ON posts_comment
+    BEGIN
+        INSERT INTO posts_search (rowid, body, post_id)
+        VALUES (new.id * 2 + 1, {body}, new.post_id);
+    END
+    """,
+    """
+    CREATE TRIGGER posts_search_comment_update
+    AFTER UPDATE OF text, post_id ON posts_comment
+    BEGIN
+        UPDATE posts_search SET body = {body}, post_id = new.post_id
+        WHERE rowid = new.id * 2 + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER posts_search_comment_delete
+    AFTER DELETE ON posts_comment
+    BEGIN
+        DELETE FROM posts_search WHERE rowid = old.id * 2 + 1;
+    END
+    """,
+    """
+    INSERT INTO posts_search (rowid, body, post_id)
+    SELECT id * 2, {text}, id FROM posts_post
+    """,
+    """
+    INSERT INTO posts_search (rowid, body, post_id)
+    SELECT id * 2 + 1, {text}, post_id FROM posts_comment
+    """,
+]
+SEARCH_SQL = [
+    sql.format(body=without_yo('new.text'), text=without_yo('text'))
+    for sql in SEARCH_SQL_TEMPLATES
+]
+
+REVERSE_SQL = [
+    'DROP TRIGGER posts_search_comment_delete',
+    'DROP TRIGGER posts_search_comment_update',
+    'DROP TRIGGER posts_search_comment_insert',
+    'DROP TRIGGER posts_search_post_delete',
+    'DROP TRIGGER posts_search_post_update',
+    'DROP TRIGGER posts_search_post_insert',
+    'DROP TABLE posts_search',
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_post_image_placeholder'),
+    ]
+
+    operations = [
+        migrations.RunSQL(SEARCH_SQL, REVERSE_SQL),
+    ]
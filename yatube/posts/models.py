@@ -1,6 +1,10 @@
 from django.db import models
+from django.db.models import F
 from django.contrib.auth import get_user_model
 
+from .images import ingest
+from .storage import ContentHashStorage
+
 User = get_user_model()
 
 
@@ -13,6 +17,12 @@ class Group(models.Model):
         return self.title
 
 
+class PostQuerySet(models.QuerySet):
+    def feed(self):
+        """Записи для ленты вместе с автором и группой одним запросом."""
+        return self.select_related('author', 'group')
+
+
 class Post(models.Model):
     # Тип: TextField
     text = models.TextField(
@@ -46,16 +56,82 @@ class Post(models.Model):
         verbose_name='Изображение',
         help_text='Загрузите изображение',
         upload_to='posts/',
+        storage=ContentHashStorage(),
         blank=True,
     )
+    # Заполняются при загрузке картинки (см. posts.images.ingest)
+    # и командой backfill_images
+    image_width = models.PositiveIntegerField(
+        verbose_name='Ширина картинки',
+        null=True,
+        editable=False,
+    )
+    image_height = models.PositiveIntegerField(
+        verbose_name='Высота картинки',
+        null=True,
+        editable=False,
+    )
+    image_bytes = models.PositiveIntegerField(
+        verbose_name='Размер картинки, байт',
+        null=True,
+        editable=False,
+    )
+    image_placeholder = models.TextField(
+        verbose_name='Заглушка картинки',
+        help_text='data URI размытой копии, пока грузится картинка',
+        blank=True,
+        editable=False,
+    )
+    comments_count = models.PositiveIntegerField(
+        verbose_name='Комментариев',
+        default=0,
+        editable=False,
+    )
+    # Меняется и с числом комментариев; имя автора и название группы
+    # ключ карточки берёт из версий, см. posts.templatetags.post_tags
+    updated = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True,
+    )
+
+    objects = PostQuerySet.as_manager()
 
     def __str__(self):
         return self.text
 
+    def save(self, *args, **kwargs):
+        if self.image and not self.image._committed:
+            # Новая загрузка: храним уже обработанную картинку
+            content, fields = ingest(self.image.file)
+            if content is not None:
+                self.image = content
+            for field, value in fields.items():
+                setattr(self, field, value)
+        elif not self.image:
+            self.image_width = self.image_height = self.image_bytes = None
+            self.image_placeholder = ''
+        super().save(*args, **kwargs)
+
     class Meta:
         ordering = ['-pub_date']
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        # Индексы повторяют ключ ленты (-pub_date, -id) внутри каждой
+        # области, чтобы страница читалась без сортировки
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='post_pub_date_idx',
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='post_author_pub_date_idx',
+            ),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='post_group_pub_date_idx',
+            ),
+        ]
 
 
 class Comment(models.Model):
@@ -79,6 +155,19 @@ class Comment(models.Model):
         auto_now_add=True
     )
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['post', 'created'],
+                name='comment_post_created_idx',
+            ),
+            # Порядок и фильтр по дате в списке комментариев админки
+            models.Index(
+                fields=['-created', '-id'],
+                name='comment_created_idx',
+            ),
+        ]
+
     def __str__(self):
         return self.text
 
@@ -100,3 +189,105 @@ class Follow(models.Model):
             'user',
             'author',
         )
+        indexes = [
+            models.Index(
+                fields=['author', 'user'],
+                name='follow_author_user_idx',
+            ),
+        ]
+
+
+class FeedEntry(models.Model):
+    """Запись ленты подписок, разложенная подписчику при публикации."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+    )
+    # Копии полей записи: чтение ленты обходится без соединения
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+    )
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        unique_together = (
+            'user',
+            'post',
+        )
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='feed_user_pub_date_idx',
+            ),
+            models.Index(
+                fields=['user', 'author'],
+                name='feed_user_author_idx',
+            ),
+        ]
+
+
+class AuthorStats(models.Model):
+    """Денормализованные счётчики пользователя.
+
+    Поддерживаются сигналами через F()-обновления, расхождения
+    исправляет команда reconcile_counters.
+    """
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+    )
+    posts_count = models.PositiveIntegerField('Записей', default=0)
+    followers_count = models.PositiveIntegerField('Подписчиков', default=0)
+    following_count = models.PositiveIntegerField('Подписок', default=0)
+
+    class Meta:
+        verbose_name = 'Счётчики автора'
+        verbose_name_plural = 'Счётчики авторов'
+
+    def __str__(self):
+        return str(self.user_id)
+
+    @classmethod
+    def recount(cls, user_id):
+        """Пересчитывает счётчики пользователя по данным."""
+        stats, _ = cls.objects.update_or_create(
+            user_id=user_id,
+            defaults={
+                'posts_count': Post.objects.filter(author_id=user_id).count(),
+                'followers_count': Follow.objects.filter(
+                    author_id=user_id).count(),
+                'following_count': Follow.objects.filter(
+                    user_id=user_id).count(),
+            },
+        )
+        return stats
+
+    @classmethod
+    def for_user(cls, user):
+        """Счётчики пользователя; недостающая строка пересчитывается."""
+        try:
+            return user.stats
+        except cls.DoesNotExist:
+            return cls.recount(user.pk)
+
+    @classmethod
+    def shift(cls, user_id, field, delta):
+        """Атомарно сдвигает счётчик field на delta.
+
+        Строку не создаёт: её заводит сигнал при регистрации, а для
+        старых пользователей - for_user или reconcile_counters.
+        """
+        stats = cls.objects.filter(user_id=user_id)
+        if delta < 0:
+            stats = stats.filter(**{field + '__gte': -delta})
+        stats.update(**{field: F(field) + delta})
@@ -0,0 +1,106 @@
+import re
+
+from django.db import connection
+
+from .helper import decode_token, encode_token
+from .models import Post
+
+# Таблица FTS5 с текстами записей и комментариев, её ведут
+# триггеры из миграции 0014_post_search
+SEARCH_TABLE = 'posts_search'
+
+# Записи по лучшему совпадению среди текста и комментариев.
+# rank - это bm25, он отрицательный: чем меньше, тем выше запись
+# в выдаче. Сам bm25() внутри MIN SQLite не разрешает
+RANKED_SQL = f'''
+    SELECT post_id, MIN(rank) AS score
+    FROM {SEARCH_TABLE}
+    WHERE {SEARCH_TABLE} MATCH %s
+    GROUP BY post_id
+    {{having}}
+    ORDER BY score, post_id
+    LIMIT %s
+'''
+AFTER_SQL = 'HAVING score > %s OR (score = %s AND post_id > %s)'
+
+
+def match_expression(query):
+    """Запрос пользователя как выражение MATCH.
+
+    От запроса остаются только слова: знаки и управляющие символы
+    (NUL обрывает строку MATCH) FTS5 всё равно не индексирует. Каждое
+    слово берётся в кавычки, чтобы ключевые слова вроде NOT и NEAR
+    не стали операторами. Слово ищется как префикс:
+    стемминга для русского в FTS5 нет, а так «туман» найдёт
+    и «тумане».
+    """
+    # «ё» в индексе заменена на «е», см. миграцию 0014_post_search
+    query = query.replace('ё', 'е').replace('Ё', 'Е')
+    return ' '.join(f'"{word}"*' for word in re.findall(r'\w+', query))
+
+
+def _filter_found(queryset, column, condition, query):
+    expression = match_expression(query)
+    if not expression:
+        return queryset.none()
+    # RawSQL в pk__in Django берёт в двойные скобки, и SQLite
+    # превращает IN ((SELECT ...)) в сравнение с первой строкой
+    opts = queryset.model._meta
+    pk = f'"{opts.db_table}"."{opts.pk.column}"'
+    return queryset.extra(
+        where=[
+            f'{pk} IN (SELECT {column} FROM {SEARCH_TABLE} '
+            f'WHERE {SEARCH_TABLE} MATCH %s{condition})'
+        ],
+        params=[expression],
+    )
+
+
+def matching(queryset, query):
+    """Записи queryset, где найден query."""
+    return _filter_found(queryset, 'post_id', '', query)
+
+
+def matching_comments(queryset, query):
+    """Комментарии queryset, где найден query."""
+    # Строки комментариев - нечётные rowid, см. миграцию 0014_post_search
+    return _filter_found(queryset, 'rowid / 2', ' AND rowid & 1', query)
+
+
+def decode_cursor(token):
+    try:
+        score, post_id = decode_token(token)
+        return float(score), int(post_id)
+    except (ValueError, TypeError):
+        return None
+
+
+def search(query, cursor=None, limit=10):
+    """Страница найденных записей и курсор следующей.
+
+    Страницы идут по ключу (score, post_id) без OFFSET, поэтому
+    дальняя страница стоит столько же, сколько первая. Курсор
+    следующей страницы - None, если её нет.
+    """
+    expression = match_expression(query)
+    if not expression:
+        return [], None
+    params = [expression]
+    having = ''
+    after = cursor and decode_cursor(cursor)
+    if after:
+        having = AFTER_SQL
+        params += [after[0], after[0], after[1]]
+    # Лишняя строка показывает, есть ли страница дальше
+    params.append(limit + 1)
+    with connection.cursor() as db:
+        db.execute(RANKED_SQL.format(having=having), params)
+        rows = db.fetchall()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        post_id, score = rows[-1]
+        next_cursor = encode_token([score, post_id])
+    posts = Post.objects.feed().in_bulk([post_id for post_id, _ in rows])
+    found = [posts[post_id] for post_id, _ in rows if post_id in posts]
+    return found, next_cursor
@@ -0,0 +1,280 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import (
+    post_delete, post_save, pre_save,
+)
+from django.utils import timezone
+from django.dispatch import receiver
+from sorl.thumbnail import delete as sorl_delete
+from sorl.thumbnail.images import ImageFile
+
+from . import feeds, thumbnails
+from .counts import forget_counts, shift_counts
+from .models import AuthorStats, Comment, Follow, Group, Post, User
+from .versions import bump
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(pre_save, sender=Post)
+def remember_previous(sender, instance, **kwargs):
+    """Запоминает прежние группу и картинку редактируемой записи."""
+    instance._previous_group_id = None
+    instance._previous_image = None
+    if instance.pk is not None:
+        previous = Post.objects.filter(
+            pk=instance.pk).values_list('group_id', 'image').first()
+        if previous is not None:
+            instance._previous_group_id, instance._previous_image = previous
+
+
+# Поля, которые страницы и карточки записей показывают
+SHOWN_FIELDS = {
+    User: ('username', 'first_name', 'last_name'),
+    Group: ('title', 'slug'),
+}
+
+
+@receiver(pre_save, sender=User)
+@receiver(pre_save, sender=Group)
+def remember_shown(sender, instance, update_fields=None, **kwargs):
+    """Запоминает показываемые поля пользователя или группы до правки."""
+    fields = SHOWN_FIELDS[sender]
+    instance._previous_shown = None
+    if instance.pk is None:
+        return
+    if update_fields is not None and not set(update_fields) & set(fields):
+        # Например, вход сохраняет только last_login
+        return
+    instance._previous_shown = sender.objects.filter(
+        pk=instance.pk).values_list(*fields).first()
+
+
+def shown_changed(sender, instance):
+    previous = getattr(instance, '_previous_shown', None)
+    return previous is not None and previous != tuple(
+        getattr(instance, field) for field in SHOWN_FIELDS[sender])
+
+
+def is_fresh(storage, name):
+    cutoff = timezone.now() - timedelta(
+        seconds=settings.POSTS_IMAGE_RELEASE_AGE)
+    try:
+        return storage.get_modified_time(name) >= cutoff
+    except FileNotFoundError:
+        # Файла уже нет, но миниатюры и записи sorl могли остаться
+        return False
+
+
+def release_image(name):
+    """Удаляет картинку и её миниатюры, если она больше не нужна.
+
+    Одинаковые загрузки хранятся одним файлом, поэтому удалять его
+    можно, только когда на него не ссылается ни одна запись. Свежий
+    файл остаётся для gc_media: повторная загрузка обновляет его
+    дату, а её запись может быть ещё не зафиксирована.
+    """
+    def release():
+        storage = Post._meta.get_field('image').storage
+        try:
+            if is_fresh(storage, name):
+                return
+            if Post.objects.filter(image=name).exists():
+                return
+            sorl_delete(ImageFile(name, storage))
+        except Exception:
+            # Транзакция уже зафиксирована: оставшийся файл не повод
+            # ронять запрос
+            logger.exception('Не удалось удалить картинку %s', name)
+
+    if name:
+        transaction.on_commit(release)
+
+
+@receiver(post_save, sender=Post)
+def release_replaced_image(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        if instance._previous_image != instance.image.name:
+            release_image(instance._previous_image)
+
+
+@receiver(post_delete, sender=Post)
+def release_deleted_image(sender, instance, **kwargs):
+    release_image(instance.image.name)
+
+
+@receiver(post_save, sender=Post)
+def thumbnail_post(sender, instance, raw=False, **kwargs):
+    if not raw and instance.image.name != instance._previous_image:
+        thumbnails.schedule(instance.image.name)
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, **kwargs):
+    if created:
+        feeds.fan_out(instance)
+
+
+@receiver(post_save, sender=Post)
+def count_saved_post(sender, instance, created, **kwargs):
+    if created:
+        scopes = [('all',), ('author', instance.author_id)]
+        if instance.group_id:
+            scopes.append(('group', instance.group_id))
+        shift_counts(scopes, 1)
+        # Записи популярного автора лента считает по его области
+        # ('author', id), сдвинутой выше
+        if not feeds.is_pulled(instance.author_id):
+            forget_counts(feeds.follower_feeds(instance.author_id))
+        return
+    previous = instance._previous_group_id
+    if previous != instance.group_id:
+        if previous:
+            shift_counts([('group', previous)], -1)
+        if instance.group_id:
+            shift_counts([('group', instance.group_id)], 1)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    scopes = [('all',), ('author', instance.author_id)]
+    if instance.group_id:
+        scopes.append(('group', instance.group_id))
+    shift_counts(scopes, -1)
+    if not feeds.is_pulled(instance.author_id):
+        forget_counts(feeds.follower_feeds(instance.author_id))
+
+
+@receiver(post_delete, sender=Group)
+def count_deleted_group(sender, instance, **kwargs):
+    forget_counts([('group', instance.pk)])
+
+
+@receiver(post_save, sender=Follow)
+def fill_feed(sender, instance, created, **kwargs):
+    if created:
+        feeds.follow(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def prune_feed(sender, instance, **kwargs):
+    feeds.unfollow(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def count_follow(sender, instance, **kwargs):
+    forget_counts([('feed', instance.user_id)])
+
+
+@receiver(post_save, sender=User)
+def create_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        AuthorStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Post)
+def stats_saved_post(sender, instance, created, **kwargs):
+    if created:
+        AuthorStats.shift(instance.author_id, 'posts_count', 1)
+
+
+@receiver(post_delete, sender=Post)
+def stats_deleted_post(sender, instance, **kwargs):
+    AuthorStats.shift(instance.author_id, 'posts_count', -1)
+
+
+@receiver(post_save, sender=Comment)
+def stats_saved_comment(sender, instance, created, **kwargs):
+    if created:
+        Post.objects.filter(pk=instance.post_id).update(
+            comments_count=F('comments_count') + 1, updated=timezone.now())
+
+
+@receiver(post_delete, sender=Comment)
+def stats_deleted_comment(sender, instance, **kwargs):
+    Post.objects.filter(
+        pk=instance.post_id, comments_count__gt=0,
+    ).update(comments_count=F('comments_count') - 1, updated=timezone.now())
+
+
+@receiver(post_save, sender=Follow)
+def stats_saved_follow(sender, instance, created, **kwargs):
+    if created:
+        AuthorStats.shift(instance.author_id, 'followers_count', 1)
+        AuthorStats.shift(instance.user_id, 'following_count', 1)
+
+
+@receiver(post_delete, sender=Follow)
+def stats_deleted_follow(sender, instance, **kwargs):
+    AuthorStats.shift(instance.author_id, 'followers_count', -1)
+    AuthorStats.shift(instance.user_id, 'following_count', -1)
+
+
+def post_scopes(post):
+    scopes = [('all',), ('author', post.author_id)]
+    if post.group_id:
+        scopes.append(('group', post.group_id))
+    return scopes
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def version_post(sender, instance, **kwargs):
+    scopes = post_scopes(instance)
+    previous = getattr(instance, '_previous_group_id', None)
+    if previous and previous != instance.group_id:
+        scopes.append(('group', previous))
+    bump(scopes)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def version_comment(sender, instance, **kwargs):
+    # Карточки записей показывают число комментариев
+    post = Post.objects.filter(pk=instance.post_id).first()
+    if post is not None:
+        bump(post_scopes(post))
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def version_group(sender, instance, **kwargs):
+    bump([('all',), ('groups',), ('group', instance.pk)])
+
+
+@receiver(post_save, sender=User)
+def version_user(sender, instance, created, raw=False, **kwargs):
+    # Страницы показывают только имя пользователя: вход, смена пароля
+    # и регистрация их не меняют
+    if created or raw or not shown_changed(sender, instance):
+        return
+    bump([
+        ('all',), ('users',), ('author', instance.pk),
+        ('author_name', instance.pk),
+    ])
+
+
+@receiver(post_delete, sender=User)
+def version_deleted_user(sender, instance, **kwargs):
+    bump([('all',), ('users',), ('author', instance.pk)])
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def version_follow(sender, instance, **kwargs):
+    # Профили показывают подписчиков, подписки и кнопку подписки
+    bump([('author', instance.author_id), ('author', instance.user_id)])
+
+
+@receiver(post_save, sender=Group)
+def version_group_name(sender, instance, created, raw=False, **kwargs):
+    # Карточки записей ключуются версией названия группы, см.
+    # posts.templatetags.post_tags. Удалённую группу менять не нужно:
+    # у её записей обнулится group_id, а с ним и ключ карточки
+    if not created and not raw and shown_changed(sender, instance):
+        bump([('group_name', instance.pk)])
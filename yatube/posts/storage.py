@@ -0,0 +1,46 @@
+import hashlib
+import os
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+def content_hash(content):
+    """sha256 содержимого файла, читая его кусками."""
+    digest = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+@deconstructible
+class ContentHashStorage(FileSystemStorage):
+    """Хранилище, где имя файла - хэш его содержимого.
+
+    Файл кладётся в каталог из upload_to как <хэш[:2]>/<хэш>.<расширение>,
+    одинаковые загрузки хранятся один раз, а их миниатюры у sorl
+    общие: он ключует их по имени исходника. Удалять файл можно,
+    только когда на него не ссылается ни одна запись.
+    """
+
+    def hashed_name(self, name, content):
+        directory, filename = os.path.split(name)
+        digest = content_hash(content)
+        extension = os.path.splitext(filename)[1].lower()
+        return os.path.join(directory, digest[:2], digest + extension)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(name, content)
+        if self.exists(name):
+            # Повторная загрузка: свежее время не даст gc_media удалить
+            # файл, пока запись под ним ещё не сохранена
+            os.utime(self.path(name))
+            return name
+        return super().save(name, content, max_length=max_length)
@@ -0,0 +1,12 @@
+from django import template
+
+from posts.helper import elided_page_range
+
+register = template.Library()
+
+
+@register.filter
+def elided_range(page_obj, on_each_side=2):
+    """Окно номеров страниц вокруг текущей с многоточиями."""
+    return list(elided_page_range(
+        page_obj.number, page_obj.paginator.num_pages, int(on_each_side)))
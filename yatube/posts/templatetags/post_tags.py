@@ -0,0 +1,75 @@
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from posts.thumbnails import resolve
+from posts.versions import digest, versions
+
+register = template.Library()
+
+CARD_KEY = 'posts:card:{}:{}:{}:{:d}{:d}'
+CARD_TEMPLATE = 'posts/includes/post_show.html'
+
+
+def card_scopes(post):
+    scopes = [('author_name', post.author_id)]
+    if post.group_id:
+        scopes.append(('group_name', post.group_id))
+    return scopes
+
+
+def card_keys(posts, show_group, show_profile):
+    """Ключи карточек записей.
+
+    Правку самой записи ключ ловит по post.updated, правку имени
+    автора и названия группы - по версиям их областей, взятым
+    одним обращением к кэшу.
+    """
+    scopes = list(dict.fromkeys(
+        scope for post in posts for scope in card_scopes(post)))
+    found = dict(zip(scopes, versions(scopes)))
+    return [
+        CARD_KEY.format(
+            post.pk,
+            post.updated.timestamp(),
+            digest([post.group_id] + [
+                found[scope] for scope in card_scopes(post)]),
+            show_group,
+            show_profile,
+        )
+        for post in posts
+    ]
+
+
+@register.simple_tag
+def post_cards(posts, show_group=False, show_profile=False):
+    """Отрендеренные карточки записей страницы.
+
+    Все карточки читаются из кэша одним get_many, недостающие
+    рендерятся, их миниатюры ищутся тоже одним обращением.
+    """
+    posts = list(posts)
+    if not posts:
+        return []
+    keys = card_keys(posts, show_group, show_profile)
+    cards = cache.get_many(keys)
+    missing = [
+        (key, post) for key, post in zip(keys, posts) if key not in cards
+    ]
+    resolve([post for _, post in missing])
+    rendered = {}
+    for key, post in missing:
+        cards[key] = render_to_string(CARD_TEMPLATE, {
+            'post': post,
+            'show_group': show_group,
+            'show_profile': show_profile,
+        })
+        # Карточку с исходной картинкой вместо миниатюры не кэшируем:
+        # миниатюра скоро появится
+        if post.thumbnail_ready:
+            rendered[key] = cards[key]
+    if rendered:
+        cache.set_many(rendered, settings.POSTS_CARD_CACHE_TIMEOUT)
+    return [mark_safe(cards[key]) for key in keys]
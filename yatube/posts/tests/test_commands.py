@@ -0,0 +1,217 @@
+import os
+import shutil
+import tempfile
+import time
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from PIL import Image
+from sorl.thumbnail import default as sorl_default
+from sorl.thumbnail.images import ImageFile
+
+from posts import thumbnails
+from posts.management.commands.check_query_plans import BAD_PLAN
+from posts.management.commands.gc_media import GC_MIN_AGE
+from posts.models import Post
+
+User = get_user_model()
+
+
+class CheckQueryPlansTest(TestCase):
+    def test_feed_queries_use_indexes(self):
+        """Запросы лент читают индексы без полного просмотра и сортировки."""
+        out = StringIO()
+        call_command('check_query_plans', stdout=out)
+        self.assertNotIn('FAIL', out.getvalue())
+
+    def test_bad_plans_are_detected(self):
+        """Полный просмотр таблицы и временное B-дерево считаются ошибкой."""
+        plans = {
+            'SCAN posts_post': True,
+            'SCAN TABLE posts_post': True,
+            'USE TEMP B-TREE FOR ORDER BY': True,
+            'SCAN posts_post USING INDEX post_pub_date_idx': False,
+            'SEARCH posts_post USING INDEX post_group_pub_date_idx '
+            '(group_id=?)': False,
+        }
+        for line, bad in plans.items():
+            with self.subTest(line=line):
+                self.assertEqual(bool(BAD_PLAN.search(line)), bad)
+
+
+class ThumbnailReportTest(TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path, ignore_errors=True)
+        Image.new('RGB', (1200, 800), 'orange').save(
+            os.path.join(self.path, 'photo.jpg'))
+        with open(os.path.join(self.path, 'notes.txt'), 'w') as file:
+            file.write('not an image')
+
+    def test_report_lists_variants(self):
+        """Отчёт считает картинки и показывает каждый вариант."""
+        out = StringIO()
+        call_command('thumbnail_report', '--path', self.path, stdout=out)
+        report = out.getvalue()
+        self.assertIn('Картинок: 1', report)
+        self.assertIn('480 WEBP', report)
+        self.assertIn('960 JPEG', report)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class GcMediaTest(TestCase):
+    def setUp(self):
+        self.addCleanup(
+            shutil.rmtree, settings.MEDIA_ROOT, ignore_errors=True)
+        cache.clear()
+        self.storage = Post._meta.get_field('image').storage
+        user = User.objects.create_user(username='auth')
+        self.post = Post.objects.create(
+            text='Text', author=user,
+            image=ContentFile(self.gif('white'), name='used.gif'))
+        self.orphan = self.storage.save(
+            'posts/orphan.gif', ContentFile(self.gif('red')))
+        self.fresh = self.storage.save(
+            'posts/fresh.gif', ContentFile(self.gif('blue')))
+        self.stray = sorl_default.storage.save(
+            'cache/ab/cd/stray.gif', ContentFile(self.gif('green')))
+        # Исходник удалённой записи, чьи миниатюры остались в sorl
+        self.source = ImageFile(
+            self.storage.save(
+                'posts/deleted.gif', ContentFile(self.gif('black'))),
+            self.storage,
+        )
+        self.thumbnail = ImageFile(
+            sorl_default.storage.save(
+                'cache/ef/gh/thumbnail.gif', ContentFile(self.gif('gray'))),
+            sorl_default.storage,
+        )
+        sorl_default.kvstore.set(self.source)
+        sorl_default.kvstore.set(self.thumbnail, self.source)
+        past = time.time() - 2 * GC_MIN_AGE
+        for name in (self.post.image.name, self.orphan, self.source.name):
+            os.utime(self.storage.path(name), (past, past))
+        for name in (self.stray, self.thumbnail.name):
+            os.utime(sorl_default.storage.path(name), (past, past))
+
+    def gif(self, color):
+        buffer = BytesIO()
+        Image.new('RGB', (2, 1), color).save(buffer, 'GIF')
+        return buffer.getvalue()
+
+    def test_dry_run_keeps_files(self):
+        """Без --dry-run файлы удаляются, с ним - только считаются."""
+        out = StringIO()
+        call_command('gc_media', '--dry-run', stdout=out)
+        self.assertIn('Исходников в хранилище sorl: 1', out.getvalue())
+        self.assertIn('миниатюр: 1', out.getvalue())
+        for name in (self.orphan, self.source.name):
+            self.assertTrue(self.storage.exists(name))
+        self.assertTrue(sorl_default.storage.exists(self.stray))
+
+    def test_orphans_are_deleted(self):
+        """Удаляются сироты, но не используемые и не свежие файлы."""
+        call_command('gc_media', '--batch-size', '2', stdout=StringIO())
+        self.assertTrue(self.storage.exists(self.post.image.name))
+        self.assertTrue(self.storage.exists(self.fresh))
+        self.assertFalse(self.storage.exists(self.orphan))
+        self.assertFalse(self.storage.exists(self.source.name))
+        self.assertFalse(sorl_default.storage.exists(self.stray))
+        self.assertFalse(sorl_default.storage.exists(self.thumbnail.name))
+        self.assertIsNone(sorl_default.kvstore.get(self.source))
+        self.assertIsNone(sorl_default.kvstore.get(self.thumbnail))
+
+    def test_reuploaded_orphan_is_kept(self):
+        """Повторная загрузка того же файла делает его снова свежим."""
+        self.storage.save('posts/again.gif', ContentFile(self.gif('red')))
+        call_command('gc_media', stdout=StringIO())
+        self.assertTrue(self.storage.exists(self.orphan))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class BackfillImagesTest(TestCase):
+    def setUp(self):
+        self.addCleanup(
+            shutil.rmtree, settings.MEDIA_ROOT, ignore_errors=True)
+        storage = Post._meta.get_field('image').storage
+        buffer = BytesIO()
+        Image.new('RGB', (300, 200), 'orange').save(buffer, 'PNG')
+        name = storage.save('posts/old.png', ContentFile(buffer.getvalue()))
+        user = User.objects.create_user(username='auth')
+        # Записи, загруженные до появления полей: save их не заполнял
+        self.post = Post.objects.create(text='Old', author=user, image=name)
+        self.lost = Post.objects.create(
+            text='Lost', author=user, image='posts/lost.png')
+        self.size = len(buffer.getvalue())
+
+    def test_backfill_fills_fields(self):
+        """Команда заполняет поля картинок и пропускает пропавшие файлы."""
+        out = StringIO()
+        call_command('backfill_images', stdout=out, stderr=StringIO())
+        self.assertIn('Заполнено записей: 1, без файла: 1', out.getvalue())
+        self.post.refresh_from_db()
+        self.assertEqual(
+            (self.post.image_width, self.post.image_height), (300, 200))
+        self.assertEqual(self.post.image_bytes, self.size)
+        self.assertTrue(self.post.image_placeholder.startswith('data:'))
+
+
+class BackfillThumbnailsTest(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.checkpoint = os.path.join(directory, 'checkpoint')
+        user = User.objects.create_user(username='auth')
+        for image in ('posts/a.jpg', 'posts/b.jpg', 'posts/a.jpg', ''):
+            Post.objects.create(text='Text', author=user, image=image)
+        self.generated = []
+        patcher = mock.patch.object(thumbnails, 'generate', self.generate)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def generate(self, name):
+        self.generated.append(name)
+        return name != 'posts/b.jpg'
+
+    def backfill(self, *args):
+        out = StringIO()
+        call_command(
+            'backfill_thumbnails', '--workers', '0', '--batch-size', '1',
+            '--checkpoint', self.checkpoint, *args, stdout=out)
+        return out.getvalue()
+
+    def test_backfill_reports_progress(self):
+        """Все картинки обрабатываются, ошибки и скорость в отчёте."""
+        out = self.backfill()
+        self.assertEqual(
+            self.generated, ['posts/a.jpg', 'posts/b.jpg', 'posts/a.jpg'])
+        self.assertIn('Готово: картинок 3, ошибок 1', out)
+        self.assertIn('в секунду', out)
+
+    def test_backfill_resumes_from_checkpoint(self):
+        """Прерванный проход продолжается с сохранённой точки."""
+        calls = []
+
+        def interrupted(name):
+            calls.append(name)
+            if len(calls) == 2:
+                raise KeyboardInterrupt
+            return True
+
+        with mock.patch.object(thumbnails, 'generate', interrupted):
+            with self.assertRaises(KeyboardInterrupt):
+                self.backfill()
+        out = self.backfill()
+        self.assertIn('Продолжаем после записи', out)
+        self.assertEqual(self.generated, ['posts/b.jpg', 'posts/a.jpg'])
+        self.generated.clear()
+        self.backfill()
+        self.assertEqual(self.generated, [])
+        self.backfill('--restart')
+        self.assertEqual(len(self.generated), 3)
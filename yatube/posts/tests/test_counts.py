@@ -0,0 +1,150 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from posts.counts import cached_count, count_key
+from posts.models import AuthorStats, Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+class CountsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.follower = User.objects.create_user(username='follower')
+        cls.group = Group.objects.create(
+            title='Test group',
+            slug='test_slug',
+            description='Test description',
+        )
+        cls.group_2 = Group.objects.create(
+            title='Test group 2',
+            slug='test_slug_2',
+            description='Test description 2',
+        )
+        Follow.objects.create(user=cls.follower, author=cls.author)
+        cls.post = Post.objects.create(
+            text='Test text',
+            author=cls.author,
+            group=cls.group,
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.scopes = {
+            ('all',): Post.objects.all(),
+            ('group', self.group.pk): Post.objects.filter(group=self.group),
+            ('group', self.group_2.pk): Post.objects.filter(
+                group=self.group_2),
+            ('author', self.author.pk): self.author.posts.all(),
+            ('feed', self.follower.pk): Post.objects.filter(
+                author__following__user=self.follower),
+        }
+        for scope, queryset in self.scopes.items():
+            cached_count(scope, queryset)
+
+    def assertCountsActual(self):
+        for scope, queryset in self.scopes.items():
+            with self.subTest(scope=scope):
+                self.assertEqual(
+                    cached_count(scope, queryset), queryset.count())
+
+    def test_counts_follow_create_and_delete(self):
+        """Счётчики областей следуют за созданием и удалением записей."""
+        post = Post.objects.create(
+            text='New text', author=self.author, group=self.group)
+        self.assertCountsActual()
+        post.delete()
+        self.assertCountsActual()
+
+    def test_counts_follow_group_change(self):
+        """Перенос записи в другую группу меняет счётчики групп."""
+        self.post.group = self.group_2
+        self.post.save()
+        self.assertCountsActual()
+        self.post.group = self.group
+        self.post.save()
+
+    def test_cached_count_skips_query(self):
+        """Закэшированный счётчик не обращается к базе."""
+        with self.assertNumQueries(0):
+            cached_count(('all',), Post.objects.all())
+
+    def test_feed_count_reset_on_follow(self):
+        """Подписка сбрасывает счётчик ленты подписчика."""
+        Follow.objects.filter(user=self.follower).delete()
+        Follow.objects.create(user=self.follower, author=self.author)
+        self.assertIsNone(cache.get(count_key(('feed', self.follower.pk))))
+
+    def test_paginator_uses_cached_count(self):
+        """Пагинатор берёт число записей из кэша."""
+        cache.set(count_key(('all',)), 25)
+        response = Client().get(reverse('posts:index'))
+        self.assertEqual(response.context['page_obj'].paginator.count, 25)
+        self.assertEqual(response.context['page_obj'].paginator.num_pages, 3)
+
+
+class AuthorStatsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.follower = User.objects.create_user(username='follower')
+
+    def assertStats(self, user, **counts):
+        stats = AuthorStats.objects.get(user=user)
+        for field, value in counts.items():
+            with self.subTest(field=field):
+                self.assertEqual(getattr(stats, field), value)
+
+    def test_counters_follow_changes(self):
+        """Счётчики следуют за записями, комментариями и подписками."""
+        post = Post.objects.create(text='Test text', author=self.author)
+        comment = Comment.objects.create(
+            post=post, author=self.follower, text='Test comment')
+        follow = Follow.objects.create(user=self.follower, author=self.author)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertStats(self.author, posts_count=1, followers_count=1)
+        self.assertStats(self.follower, following_count=1)
+        comment.delete()
+        follow.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+        post.delete()
+        self.assertStats(
+            self.author, posts_count=0, followers_count=0)
+        self.assertStats(self.follower, following_count=0)
+
+    def test_profile_reads_counters(self):
+        """Профиль показывает счётчики без подсчёта записей."""
+        AuthorStats.objects.filter(user=self.author).update(posts_count=42)
+        response = Client().get(
+            reverse('posts:profile', kwargs={'username': 'author'}))
+        self.assertEqual(response.context['stats'].posts_count, 42)
+
+    def test_reconcile_counters_repairs_drift(self):
+        """reconcile_counters исправляет расхождения и создаёт строки."""
+        post = Post.objects.create(text='Test text', author=self.author)
+        Comment.objects.create(
+            post=post, author=self.follower, text='Test comment')
+        Follow.objects.create(user=self.follower, author=self.author)
+        AuthorStats.objects.filter(user=self.author).update(
+            posts_count=7, followers_count=0)
+        AuthorStats.objects.filter(user=self.follower).delete()
+        Post.objects.filter(pk=post.pk).update(comments_count=5)
+        out = StringIO()
+        call_command('reconcile_counters', '--dry-run', stdout=out)
+        self.assertIn('Создано строк счётчиков: 1', out.getvalue())
+        self.assertStats(self.author, posts_count=7)
+        call_command('reconcile_counters', stdout=StringIO())
+        self.assertStats(self.author, posts_count=1, followers_count=1)
+        self.assertStats(self.follower, following_count=1)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
@@ -1,6 +1,11 @@
+import hashlib
+import io
+import os
 import shutil
 import tempfile
+from unittest import mock, skipUnless
 
+from posts import signals, thumbnails
 from posts.forms import PostForm, CommentForm
 from posts.models import Post, Group, Comment
 from django.conf import settings
@@ -9,6 +14,8 @@ from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
+from PIL import Image
+from sorl.thumbnail import default as sorl_default
 
 User = get_user_model()
 
@@ -79,11 +86,12 @@ class PostFormTest(TestCase):
             reverse('posts:profile', kwargs={'username': self.user}),
         )
         self.assertEqual(Post.objects.count(), post_count + 1)
+        digest = hashlib.sha256(small_gif).hexdigest()
         self.assertTrue(
             Post.objects.filter(
                 text='New text',
                 group=self.group.id,
-                image='posts/small.gif',
+                image=f'posts/{digest[:2]}/{digest}.gif',
             ).exists()
         )
 
@@ -171,3 +179,211 @@ class CommentFormTest(TestCase):
         self.assertFalse(Comment.objects.filter(
             text='Comment text').exists()
         )
+
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        # on_commit внутри TestCase не срабатывает, пул заменён вызовом
+        patcher = mock.patch.object(
+            thumbnails.transaction, 'on_commit', lambda func: func())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.submitted = []
+        patcher = mock.patch.object(thumbnails, 'executor')
+        executor = patcher.start()
+        executor.return_value.submit.side_effect = (
+            lambda func, name: self.submitted.append(name))
+        self.addCleanup(patcher.stop)
+
+    def upload(self, **data):
+        uploaded = SimpleUploadedFile(
+            name='small.gif', content=SMALL_GIF, content_type='image/gif')
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'New text', 'image': uploaded, **data},
+        )
+        return Post.objects.get(text='New text')
+
+    def test_upload_schedules_thumbnails(self):
+        """Картинка ставит миниатюры в очередь, правка текста - нет."""
+        post = self.upload()
+        self.assertEqual(self.submitted, [post.image.name])
+        self.authorized_client.post(
+            reverse('posts:post_edit', kwargs={'post_id': post.pk}),
+            data={'text': 'Edited text'},
+        )
+        self.assertEqual(self.submitted, [post.image.name])
+
+    # sorl-thumbnail 12.7 масштабирует через Image.ANTIALIAS,
+    # которого нет в Pillow новее зафиксированной 8.x
+    @skipUnless(hasattr(Image, 'ANTIALIAS'), 'нужен Pillow из requirements')
+    def test_generate_creates_thumbnails(self):
+        """После generate показ записи не обращается к PIL."""
+        post = self.upload()
+        thumbnails.generate(post.image.name)
+        with mock.patch.object(
+            sorl_default.engine, 'get_image',
+            wraps=sorl_default.engine.get_image,
+        ) as get_image:
+            response = self.authorized_client.get(
+                reverse('posts:post_detail', kwargs={'post_id': post.pk}))
+        self.assertEqual(response.status_code, 200)
+        get_image.assert_not_called()
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT,
+    POSTS_IMAGE_MAX_SIZE=(800, 800),
+)
+class ImageIngestTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def upload(self, name, content):
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={
+                'text': name,
+                'image': SimpleUploadedFile(name=name, content=content),
+            },
+        )
+        return Post.objects.get(text=name)
+
+    def test_large_photo_is_downscaled_without_exif(self):
+        """Большое фото уменьшается, EXIF убирается, размеры записаны."""
+        exif = Image.Exif()
+        exif[0x010F] = 'Phone maker'
+        buffer = io.BytesIO()
+        Image.new('RGB', (1600, 1000), 'orange').save(
+            buffer, 'JPEG', quality=100, exif=exif)
+        post = self.upload('photo.jpg', buffer.getvalue())
+        self.assertEqual((post.image_width, post.image_height), (800, 500))
+        self.assertEqual(post.image_bytes, post.image.size)
+        self.assertTrue(
+            post.image_placeholder.startswith('data:image/jpeg;base64,'))
+        self.assertLess(post.image_bytes, len(buffer.getvalue()))
+        with Image.open(post.image.path) as stored:
+            self.assertEqual(stored.size, (800, 500))
+            self.assertFalse(stored.getexif())
+
+    def test_small_image_is_kept(self):
+        """Маленькая картинка без метаданных хранится как есть."""
+        post = self.upload('small.gif', SMALL_GIF)
+        self.assertEqual((post.image_width, post.image_height), (2, 1))
+        with open(post.image.path, 'rb') as stored:
+            self.assertEqual(stored.read(), SMALL_GIF)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+@override_settings(POSTS_IMAGE_RELEASE_AGE=0)
+class ContentHashStorageTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        patcher = mock.patch.object(
+            signals.transaction, 'on_commit', lambda func: func())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(thumbnails, 'schedule')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def upload(self, text, name='small.gif', content=SMALL_GIF):
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={
+                'text': text,
+                'image': SimpleUploadedFile(name=name, content=content),
+            },
+        )
+        return Post.objects.get(text=text)
+
+    def test_same_content_is_stored_once(self):
+        """Одинаковые загрузки под разными именами - один файл."""
+        first = self.upload('First', name='small.gif')
+        second = self.upload('Second', name='copy.GIF')
+        self.assertEqual(first.image.name, second.image.name)
+        directory = os.path.dirname(first.image.path)
+        self.assertEqual(os.listdir(directory), [
+            os.path.basename(first.image.name)])
+
+    def test_file_is_deleted_with_last_post(self):
+        """Файл удаляется, только когда на него не ссылается ни одна запись."""
+        first = self.upload('First')
+        second = self.upload('Second')
+        path = first.image.path
+        first.delete()
+        self.assertTrue(os.path.exists(path))
+        second.delete()
+        self.assertFalse(os.path.exists(path))
+
+    def test_fresh_file_is_kept(self):
+        """Свежий файл не удаляется: его могла взять новая загрузка."""
+        post = self.upload('First')
+        path = post.image.path
+        with override_settings(POSTS_IMAGE_RELEASE_AGE=60):
+            post.delete()
+        self.assertTrue(os.path.exists(path))
+
+    def test_replaced_image_is_released(self):
+        """Заменённая картинка удаляется, если больше не используется."""
+        post = self.upload('First')
+        path = post.image.path
+        buffer = io.BytesIO()
+        Image.new('RGB', (4, 4), 'red').save(buffer, 'PNG')
+        self.authorized_client.post(
+            reverse('posts:post_edit', kwargs={'post_id': post.pk}),
+            data={
+                'text': 'First',
+                'image': SimpleUploadedFile(
+                    name='red.png', content=buffer.getvalue()),
+            },
+        )
+        post.refresh_from_db()
+        self.assertTrue(post.image.name.endswith('.png'))
+        self.assertFalse(os.path.exists(path))
+        self.assertTrue(os.path.exists(post.image.path))
@@ -1,11 +1,27 @@
 from django.contrib.auth import get_user_model
-from django.test import Client, TestCase
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.core.cache import cache
 from django import forms
 import datetime as dt
+import json
+from unittest import mock
+from django.conf import settings
+from sorl.thumbnail import default as sorl_default, get_thumbnail
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.kvstores.base import add_prefix
 from django.core.files.uploadedfile import SimpleUploadedFile
-from posts.models import Post, Group, Comment, Follow
+from posts.counts import count_key
+from posts.helper import elided_page_range
+from posts.models import (
+    AuthorStats, Post, Group, Comment, Follow, FeedEntry,
+)
+from posts import bulk, feeds, thumbnails
+from posts.search import search
+from posts.versions import versions
+from posts.templatetags.post_tags import post_cards
 
 User = get_user_model()
 
@@ -207,6 +223,118 @@ class PaginatorViewsTest(TestCase):
                 response = self.authorized_client.get(page)
                 self.assertEqual(len(response.context['page_obj']), number)
 
+    def test_cursor_pages(self):
+        """Курсоры ведут на соседние страницы без повторов."""
+        pages = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': 'test_slug'}),
+            reverse('posts:profile', kwargs={'username': 'auth'}),
+        )
+        for page in pages:
+            with self.subTest(page=page):
+                cache.clear()
+                first = self.authorized_client.get(page).context['page_obj']
+                second = self.authorized_client.get(
+                    page, {'cursor': first.next_cursor}).context['page_obj']
+                self.assertEqual(len(second), 3)
+                self.assertEqual(second.number, 2)
+                self.assertFalse(second.has_next())
+                self.assertFalse(
+                    {post.pk for post in first} & {post.pk for post in second}
+                )
+                back = self.authorized_client.get(
+                    page, {'cursor': second.previous_cursor},
+                ).context['page_obj']
+                self.assertEqual(
+                    [post.pk for post in back], [post.pk for post in first]
+                )
+                self.assertFalse(back.has_previous())
+                last = self.authorized_client.get(
+                    page, {'cursor': first.paginator.last_cursor},
+                ).context['page_obj']
+                self.assertEqual(
+                    last[len(last) - 1],
+                    Post.objects.order_by('pub_date', 'id').first(),
+                )
+
+    def test_page_range_is_windowed(self):
+        """Число ссылок на страницы не растёт вместе с лентой."""
+        self.assertEqual(
+            list(elided_page_range(50, 100)),
+            [1, None, 48, 49, 50, 51, 52, None, 100],
+        )
+        self.assertEqual(list(elided_page_range(2, 5)), [1, 2, 3, 4, 5])
+        cache.set(count_key(('all',)), 10 ** 6)
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertEqual(
+            response.content.decode().count('class="page-item'), 7)
+
+    def test_broken_cursor_opens_first_page(self):
+        """Испорченный курсор открывает первую страницу."""
+        # Второй токен - {"v": null, "n": 1, "b": false}
+        for token in ('broken', 'eyJ2IjogbnVsbCwgIm4iOiAxLCAiYiI6IGZhbHNlfQ'):
+            with self.subTest(token=token):
+                response = self.authorized_client.get(
+                    reverse('posts:index'), {'cursor': token})
+                page = response.context['page_obj']
+                self.assertEqual(page.number, 1)
+                self.assertEqual(len(page), 10)
+
+
+class FeedQueriesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Test group',
+            slug='test_slug',
+            description='Test description',
+        )
+        Follow.objects.create(user=cls.user, author=cls.author)
+        for number in range(15):
+            # У каждой записи свой автор и своя группа
+            author = User.objects.create_user(username=f'author_{number}')
+            group = Group.objects.create(
+                title=f'Group {number}',
+                slug=f'group_{number}',
+                description='Test description',
+            )
+            Post.objects.create(text='Test text', author=author, group=group)
+            Post.objects.create(
+                text='Test text', author=cls.author, group=group)
+            Post.objects.create(
+                text='Test text', author=author, group=cls.group)
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def count_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.authorized_client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_feed_queries_do_not_depend_on_page_size(self):
+        """Число запросов ленты не зависит от размера страницы."""
+        # сессия, пользователь, COUNT, страница (+ id и объект
+        # группы/автора, подписка; для ленты подписок - список
+        # популярных авторов)
+        pages = {
+            reverse('posts:index'): 4,
+            reverse('posts:group_list', kwargs={'slug': 'test_slug'}): 6,
+            reverse('posts:profile', kwargs={'username': 'author'}): 7,
+            reverse('posts:follow_index'): 5,
+        }
+        for url, expected in pages.items():
+            with self.subTest(url=url):
+                for limit in (5, 15):
+                    with override_settings(POSTS_LIMIT=limit):
+                        self.assertEqual(self.count_queries(url), expected)
+
 
 class CacheTests(TestCase):
     @classmethod
@@ -232,14 +360,296 @@ class CacheTests(TestCase):
     def test_cache_index(self):
         """Тест кэширования главной страницыl"""
         response = self.authorized_client.get(reverse('posts:index'))
-        post = Post.objects.get(pk=1)
+        # Без изменений страница берётся из кэша: только сессия
+        # и пользователь
+        with self.assertNumQueries(2):
+            response_2 = self.authorized_client.get(reverse('posts:index'))
+        self.assertEqual(response.content, response_2.content)
+        post = Post.objects.get(pk=self.post.pk)
         post.text = 'New text'
         post.save()
-        response_2 = self.authorized_client.get(reverse('posts:index'))
-        self.assertEqual(response.content, response_2.content)
-        cache.clear()
         response_3 = self.authorized_client.get(reverse('posts:index'))
         self.assertNotEqual(response.content, response_3.content)
+        self.assertContains(response_3, 'New text')
+
+    def test_cache_invalidated_by_related_changes(self):
+        """Группа, автор и комментарий сбрасывают кэш своих страниц."""
+        pages = {
+            'group': reverse('posts:group_list', kwargs={'slug': 'test_slug'}),
+            'profile': reverse('posts:profile', kwargs={'username': 'auth'}),
+            'index': reverse('posts:index'),
+        }
+        changes = {
+            'group title': lambda: Group.objects.filter(
+                pk=self.group.pk).first().save(),
+            'author name': self.rename_author,
+            'comment': lambda: Comment.objects.create(
+                post=self.post, author=self.user, text='Test comment'),
+        }
+        for change, apply in changes.items():
+            cached = {}
+            for name, url in pages.items():
+                self.authorized_client.get(url)
+                with CaptureQueriesContext(connection) as queries:
+                    self.authorized_client.get(url)
+                cached[name] = len(queries)
+            apply()
+            for name, url in pages.items():
+                with self.subTest(change=change, page=name):
+                    with CaptureQueriesContext(connection) as queries:
+                        self.authorized_client.get(url)
+                    self.assertGreater(len(queries), cached[name])
+
+    def test_viewer_rename_refreshes_profile(self):
+        """Новое имя смотрящего видно в шапке чужого профиля."""
+        viewer = User.objects.create_user(username='viewer')
+        client = Client()
+        client.force_login(viewer)
+        url = reverse('posts:profile', kwargs={'username': 'auth'})
+        client.get(url)
+        viewer.username = 'renamed'
+        viewer.save()
+        self.assertContains(client.get(url), 'renamed')
+
+    def rename_author(self):
+        user = User.objects.get(pk=self.user.pk)
+        user.first_name = 'Lev'
+        user.save()
+
+    def test_password_change_keeps_cache(self):
+        """Смена пароля не трогает записи автора и кэш страниц."""
+        scopes = [('all',), ('users',), ('author', self.user.pk)]
+        before = versions(scopes)
+        user = User.objects.get(pk=self.user.pk)
+        user.set_password('new-password')
+        with CaptureQueriesContext(connection) as queries:
+            user.save()
+        self.assertFalse(
+            [query for query in queries if 'posts_post' in query['sql']])
+        self.assertEqual(versions(scopes), before)
+
+    def test_login_keeps_cache(self):
+        """Вход пользователя не сбрасывает кэш страниц."""
+        self.authorized_client.get(reverse('posts:index'))
+        Client().force_login(self.user)
+        with self.assertNumQueries(2):
+            self.authorized_client.get(reverse('posts:index'))
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(text='Test text', author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_feed_not_modified(self):
+        """Клиент с текущим ETag получает 304 без запросов к базе."""
+        url = reverse('posts:index')
+        etag = self.guest_client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        # Страница другого пользователя - другая версия
+        self.assertNotEqual(self.authorized_client.get(url)['ETag'], etag)
+        Post.objects.create(text='New text', author=self.user)
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_post_detail_not_modified(self):
+        """Страница записи отвечает 304, пока запись не изменилась."""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        response = self.authorized_client.get(url)
+        # Дата записи не отражает автора, группу и шапку страницы
+        self.assertNotIn('Last-Modified', response)
+        etag = response['ETag']
+        response = self.authorized_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Comment.objects.create(
+            post=self.post, author=self.user, text='Comment')
+        response = self.authorized_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_post_detail_follows_page_parts(self):
+        """ETag записи меняют записи автора, вход и имя зрителя."""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        etag = self.guest_client.get(url)['ETag']
+        self.assertNotEqual(self.authorized_client.get(url)['ETag'], etag)
+        Post.objects.create(text='New text', author=self.user)
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        viewer = User.objects.create_user(username='viewer')
+        client = Client()
+        client.force_login(viewer)
+        etag = client.get(url)['ETag']
+        viewer.first_name = 'Renamed'
+        viewer.save()
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+class PostCardsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Test group',
+            slug='test_slug',
+            description='Test description',
+        )
+        cls.post = Post.objects.create(
+            text='Test text',
+            author=cls.user,
+            group=cls.group,
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def cards(self):
+        return ''.join(post_cards(
+            Post.objects.feed(), show_group=True, show_profile=True))
+
+    def test_cards_are_cached(self):
+        """Карточка берётся из кэша, пока запись не изменилась."""
+        self.assertIn('Test text', self.cards())
+        Post.objects.filter(pk=self.post.pk).update(text='Changed text')
+        self.assertIn('Test text', self.cards())
+        Post.objects.get(pk=self.post.pk).save()
+        self.assertIn('Changed text', self.cards())
+
+    def test_cards_follow_related_changes(self):
+        """Комментарий, группа и автор обновляют карточку."""
+        self.cards()
+        Comment.objects.create(
+            post=self.post, author=self.user, text='Test comment')
+        self.assertIn('комментариев: 1', self.cards())
+        Group.objects.filter(pk=self.group.pk).update(title='Old title')
+        group = Group.objects.get(pk=self.group.pk)
+        group.title = 'New title'
+        group.save()
+        self.assertIn('New title', self.cards())
+        user = User.objects.get(pk=self.user.pk)
+        user.first_name = 'Lev'
+        user.save()
+        self.assertIn('Lev', self.cards())
+
+    def test_cards_fetched_with_one_query(self):
+        """Закэшированные карточки не обращаются к базе."""
+        posts = list(Post.objects.feed())
+        post_cards(posts)
+        with self.assertNumQueries(0):
+            post_cards(posts)
+
+
+class ThumbnailResolveTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.ready = Post.objects.create(
+            text='Ready', author=cls.user, image='posts/ready.jpg')
+        cls.pending = Post.objects.create(
+            text='Pending', author=cls.user, image='posts/pending.jpg')
+        cls.plain = Post.objects.create(text='Plain', author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        self.thumbnails = self.store_thumbnails(self.ready)
+        cache.clear()
+
+    def store_thumbnails(self, post):
+        """Записывает варианты миниатюры post в хранилище sorl."""
+        source = ImageFile(post.image)
+        stored = {}
+        for width, image_format, geometry, options in (
+                thumbnails.variants('card')):
+            thumbnail = thumbnails.thumbnail_file(source, geometry, options)
+            sorl_default.kvstore._set_raw(
+                add_prefix(thumbnail.key),
+                json.dumps({
+                    'name': thumbnail.name,
+                    'storage': thumbnail.serialize_storage(),
+                    'size': [width, 1],
+                }),
+            )
+            stored[width, image_format] = thumbnail
+        return stored
+
+    def test_thumbnail_file_matches_sorl(self):
+        """Имена вариантов совпадают с теми, что создаёт sorl."""
+        for _, _, geometry, options in thumbnails.variants('card'):
+            with self.subTest(geometry=geometry, options=options):
+                self.assertEqual(
+                    thumbnails.thumbnail_file(
+                        ImageFile(self.ready.image), geometry, options).name,
+                    get_thumbnail(self.ready.image, geometry, **options).name,
+                )
+
+    def test_resolve_page_with_one_lookup(self):
+        """Миниатюры страницы ищутся одним запросом к хранилищу sorl."""
+        posts = [self.ready, self.pending, self.plain]
+        with self.assertNumQueries(1):
+            thumbnails.resolve(posts)
+        self.assertTrue(self.ready.thumbnail_ready)
+        self.assertEqual(
+            self.ready.thumbnail.name, self.thumbnails[960, 'JPEG'].name)
+        # Миниатюры ещё нет: показываем картинку, карточку не кэшируем
+        self.assertEqual(self.pending.thumbnail, self.pending.image)
+        self.assertFalse(self.pending.thumbnail_ready)
+        self.assertIsNone(self.plain.thumbnail)
+        with self.assertNumQueries(0):
+            thumbnails.resolve(posts)
+
+    def test_srcset_markup(self):
+        """Карточка перечисляет ширины и отдаёт WebP через <source>."""
+        html = ''.join(post_cards([self.ready]))
+        for (width, image_format), thumbnail in self.thumbnails.items():
+            with self.subTest(width=width, image_format=image_format):
+                self.assertIn(f'{thumbnail.url} {width}w', html)
+        self.assertIn('<source type="image/webp"', html)
+        self.assertIn(f'sizes="{settings.POSTS_THUMBNAIL_SIZES}"', html)
+
+    def test_dimensions_and_placeholder(self):
+        """<img> получает размеры и заглушку без чтения картинок."""
+        self.pending.image_width, self.pending.image_height = 640, 480
+        self.pending.image_placeholder = 'data:image/jpeg;base64,AAAA'
+        html = ''.join(post_cards([self.ready, self.pending]))
+        self.assertIn('width="960" height="1"', html)
+        self.assertIn('width="640" height="480"', html)
+        self.assertIn('url(data:image/jpeg;base64,AAAA)', html)
+
+    def test_ready_thumbnail_refreshes_pages(self):
+        """Готовые миниатюры сменяют картинку в закэшированной ленте."""
+        url = reverse('posts:index')
+        before = self.client.get(url)
+        thumbnail = self.store_thumbnails(self.pending)[960, 'JPEG']
+        self.assertNotContains(before, thumbnail.url)
+        thumbnails.refresh(self.pending.image.name)
+        self.assertContains(self.client.get(url), thumbnail.url)
+
+    def test_generate_skips_ready_thumbnails(self):
+        """Готовые миниатюры не создаются заново и не сбрасывают кэш."""
+        with mock.patch.object(thumbnails, 'get_thumbnail') as create, \
+                mock.patch.object(thumbnails, 'refresh') as refresh, \
+                mock.patch.object(ImageFile, 'exists', return_value=True):
+            self.assertTrue(thumbnails.generate(self.ready.image.name))
+            create.assert_not_called()
+            refresh.assert_not_called()
+            self.assertTrue(thumbnails.generate(self.pending.image.name))
+            self.assertEqual(
+                create.call_count, len(list(thumbnails.variants('card'))))
+            refresh.assert_called_once_with(self.pending.image.name)
 
 
 class FollowTest(TestCase):
@@ -306,3 +716,358 @@ class FollowTest(TestCase):
         response = self.follower_client2.get(reverse('posts:follow_index'))
         first_object = response.context['page_obj']
         self.assertFalse(first_object)
+
+    def test_feed_entries_follow_posts_and_follows(self):
+        """Новая запись попадает в ленту подписчика, отписка её убирает."""
+        self.follower_client1.get(
+            reverse(
+                'posts:profile_follow',
+                kwargs={'username': self.author},
+            )
+        )
+        post = Post.objects.create(text='Fresh text', author=self.author)
+        self.assertTrue(
+            FeedEntry.objects.filter(user=self.follower1, post=post).exists()
+        )
+        self.assertFalse(FeedEntry.objects.filter(user=self.follower2))
+        response = self.follower_client1.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            list(response.context['page_obj']), [post, self.post])
+        self.follower_client1.get(
+            reverse(
+                'posts:profile_unfollow',
+                kwargs={'username': self.author},
+            )
+        )
+        self.assertFalse(FeedEntry.objects.filter(user=self.follower1))
+
+    @override_settings(FEED_PULL_THRESHOLD=2)
+    def test_popular_author_posts_are_pulled(self):
+        """Записи популярного автора подтягиваются при чтении ленты."""
+        cache.clear()
+        other = User.objects.create_user(username='other')
+        Follow.objects.create(user=self.follower1, author=other)
+        other_post = Post.objects.create(text='Other text', author=other)
+        for follower in (self.follower1, self.follower2):
+            Follow.objects.create(user=follower, author=self.author)
+        post = Post.objects.create(text='Fresh text', author=self.author)
+        self.assertFalse(FeedEntry.objects.filter(post=post))
+        response = self.follower_client1.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            list(response.context['page_obj']),
+            [post, other_post, self.post],
+        )
+        # Ниже порога записи автора снова раскладываются по лентам,
+        # но не в запросе отписки, а в пуле
+        jobs = []
+        with mock.patch.object(
+                feeds.transaction, 'on_commit', lambda func: func()), \
+                mock.patch.object(feeds, 'executor') as executor:
+            executor.return_value.submit.side_effect = (
+                lambda func, *args: jobs.append((func, args)))
+            Follow.objects.filter(user=self.follower2).delete()
+        self.assertFalse(
+            FeedEntry.objects.filter(user=self.follower1, post=post).exists()
+        )
+        (job, args), = jobs
+        # Внутри TestCase соединение закрывать нельзя
+        with mock.patch.object(feeds.connections, 'close_all'):
+            job(*args)
+        self.assertTrue(
+            FeedEntry.objects.filter(user=self.follower1, post=post).exists()
+        )
+        response = self.follower_client1.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            list(response.context['page_obj']),
+            [post, other_post, self.post],
+        )
+
+    @override_settings(FEED_PULL_THRESHOLD=1)
+    def test_pulled_posts_counted(self):
+        """Новая запись популярного автора видна в числе страниц ленты."""
+        cache.clear()
+        Follow.objects.create(user=self.follower1, author=self.author)
+        Post.objects.bulk_create(
+            Post(text=f'Text {number}', author=self.author)
+            for number in range(settings.POSTS_LIMIT - 1)
+        )
+        url = reverse('posts:follow_index')
+        page = self.follower_client1.get(url).context['page_obj']
+        self.assertEqual(page.paginator.count, settings.POSTS_LIMIT)
+        Post.objects.create(text='Fresh text', author=self.author)
+        page = self.follower_client1.get(url).context['page_obj']
+        self.assertEqual(page.paginator.count, settings.POSTS_LIMIT + 1)
+        self.assertTrue(page.has_next())
+
+
+class SearchTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.title = Post.objects.create(
+            text='Ёжик в тумане', author=cls.user)
+        cls.commented = Post.objects.create(
+            text='Про мультфильмы', author=cls.user)
+        Comment.objects.create(
+            post=cls.commented, author=cls.user, text='Смотрел про ежика')
+        cls.other = Post.objects.create(text='Другое', author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+
+    def search(self, query, **params):
+        return self.client.get(
+            reverse('posts:search'), {'q': query, **params})
+
+    def test_search_posts_and_comments(self):
+        """Находятся записи по тексту и по комментариям, без регистра."""
+        response = self.search('ежик')
+        self.assertEqual(
+            set(response.context['posts']), {self.title, self.commented})
+        self.assertEqual(list(self.search('"ТУМАНЕ').context['posts']),
+                         [self.title])
+        self.assertEqual(list(self.search('').context['posts']), [])
+
+    def test_control_characters_ignored(self):
+        """Управляющие символы и знаки в запросе не ломают поиск."""
+        self.assertEqual(list(self.search('\x00').context['posts']), [])
+        self.assertEqual(
+            list(self.search('туман\x00 "(*').context['posts']),
+            [self.title],
+        )
+
+    def test_index_follows_changes(self):
+        """Индекс следует за правкой и удалением записей."""
+        self.other.text = 'Ежик нашёлся'
+        self.other.save()
+        self.assertIn(self.other, self.search('ежик').context['posts'])
+        Comment.objects.filter(post=self.commented).delete()
+        Post.objects.filter(pk=self.title.pk).delete()
+        self.assertEqual(
+            list(self.search('ежик').context['posts']), [self.other])
+
+    def test_keyset_pages(self):
+        """Страницы выдачи не повторяют и не теряют записи."""
+        for number in range(settings.POSTS_LIMIT + 3):
+            Post.objects.create(text=f'Ежик номер {number}', author=self.user)
+        first = self.search('ежик')
+        cursor = first.context['next_cursor']
+        self.assertEqual(len(first.context['posts']), settings.POSTS_LIMIT)
+        second = self.search('ежик', cursor=cursor)
+        self.assertIsNone(second.context['next_cursor'])
+        found = first.context['posts'] + second.context['posts']
+        self.assertEqual(len(found), len(set(found)))
+        self.assertEqual(len(found), settings.POSTS_LIMIT + 5)
+        # Испорченный курсор открывает первую страницу
+        for token in ('broken', 'e30'):
+            with self.subTest(token=token):
+                self.assertEqual(
+                    self.search('ежик', cursor=token).context['posts'],
+                    first.context['posts'],
+                )
+
+    def test_admin_search_uses_index(self):
+        """Поиск в админке находит записи через индекс."""
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass')
+        self.client.force_login(admin)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'туман'})
+        self.assertEqual(
+            list(response.context['cl'].result_list), [self.title])
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'ежик'})
+        self.assertEqual(
+            set(response.context['cl'].result_list),
+            {self.title, self.commented},
+        )
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': '\x00'})
+        self.assertEqual(list(response.context['cl'].result_list), [])
+
+
+class PostAdminTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass')
+        cls.group = Group.objects.create(title='Group', slug='group')
+        Post.objects.bulk_create(
+            Post(text=f'Text {number}', author=cls.admin, group=cls.group)
+            for number in range(5)
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+
+    def changelist(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse('admin:posts_post_changelist'), params)
+        self.assertEqual(response.status_code, 200)
+        return response, [query['sql'] for query in queries]
+
+    def test_changelist_without_full_count(self):
+        """Список не считает всю таблицу, автор и группа - одним JOIN."""
+        response, queries = self.changelist()
+        self.assertEqual(response.context['cl'].result_count, 5)
+        counts = [sql for sql in queries if 'COUNT(' in sql]
+        self.assertTrue(counts)
+        for sql in counts:
+            self.assertIn('LIMIT', sql)
+        # Число всех записей дальше берётся из кэша
+        _, queries = self.changelist()
+        self.assertFalse([sql for sql in queries if 'COUNT(' in sql])
+        results = [
+            sql for sql in queries
+            if 'INNER JOIN "auth_user"' in sql and '"posts_group"' in sql
+        ]
+        self.assertEqual(len(results), 1)
+        self.assertNotContains(response, '<select name="form-0-group"')
+
+    def test_filtered_changelist_counts_with_limit(self):
+        """Фильтр по дате считается с LIMIT, без полного COUNT(*)."""
+        response, queries = self.changelist(pub_date__gte='2000-01-01')
+        self.assertEqual(response.context['cl'].result_count, 5)
+        for sql in queries:
+            if 'COUNT(' in sql:
+                self.assertIn('LIMIT', sql)
+
+
+class BulkActionsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass')
+        cls.author = User.objects.create_user(username='author')
+        cls.follower = User.objects.create_user(username='follower')
+        Follow.objects.create(user=cls.follower, author=cls.author)
+        cls.group = Group.objects.create(title='Group', slug='group')
+        cls.other = Group.objects.create(title='Other', slug='other')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+        self.posts = [
+            Post.objects.create(
+                text=f'Bulk text {number}', author=self.author,
+                group=self.group)
+            for number in range(5)
+        ]
+        for post in self.posts[:2]:
+            Comment.objects.create(
+                post=post, author=self.follower, text='Bulk comment')
+
+    def action(self, model, action, pks, **data):
+        return self.client.post(
+            reverse(f'admin:posts_{model}_changelist'),
+            {'action': action, '_selected_action': pks, **data},
+        )
+
+    def group_count(self, group):
+        url = reverse('posts:group_list', kwargs={'slug': group.slug})
+        return self.client.get(url).context['page_obj'].paginator.count
+
+    def test_move_and_clear_group(self):
+        """Перенос и снятие группы правят счётчики и кэш страниц."""
+        self.assertEqual(self.group_count(self.group), 5)
+        self.assertEqual(self.group_count(self.other), 0)
+        pks = [post.pk for post in self.posts[:3]]
+        self.action('post', 'move_to_group', pks, group=self.other.pk)
+        self.assertEqual(
+            Post.objects.filter(group=self.other).count(), 3)
+        self.assertEqual(self.group_count(self.group), 2)
+        self.assertEqual(self.group_count(self.other), 3)
+        self.action('post', 'clear_group', pks)
+        self.assertEqual(
+            Post.objects.filter(group__isnull=True).count(), 3)
+        self.assertEqual(self.group_count(self.other), 0)
+
+    def test_move_to_missing_group(self):
+        """Без существующей группы записи остаются на месте."""
+        self.action('post', 'move_to_group', [self.posts[0].pk], group=999)
+        self.assertEqual(Post.objects.filter(group=self.group).count(), 5)
+
+    def test_delete_posts(self):
+        """Удаление записей подтверждается и правит всё производное."""
+        pks = [post.pk for post in self.posts[:3]]
+        response = self.action('post', 'delete_posts', pks)
+        self.assertTemplateUsed(
+            response, 'admin/posts/bulk_delete_confirmation.html')
+        self.assertEqual(Post.objects.count(), 5)
+        self.action('post', 'delete_posts', pks, post='yes')
+        self.assertEqual(Post.objects.count(), 2)
+        self.assertFalse(Comment.objects.exists())
+        self.assertFalse(FeedEntry.objects.filter(post_id__in=pks).exists())
+        self.assertEqual(
+            AuthorStats.objects.get(user=self.author).posts_count, 2)
+        self.assertEqual(self.group_count(self.group), 2)
+        self.assertEqual(len(search('bulk')[0]), 2)
+
+    def test_delete_comments(self):
+        """Удаление комментариев пересчитывает их число у записей."""
+        post = self.posts[0]
+        Comment.objects.create(post=post, author=self.follower, text='Keep')
+        deleted = bulk.delete_comments(
+            Comment.objects.filter(text='Bulk comment'), size=1)
+        self.assertEqual(deleted, 2)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.posts[1].refresh_from_db()
+        self.assertEqual(self.posts[1].comments_count, 0)
+        self.assertEqual(
+            [found.pk for found in search('keep')[0]], [post.pk])
+
+
+class CommentFollowAdminTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass')
+        cls.spammer = User.objects.create_user(username='spammer')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.post = Post.objects.create(text='Text', author=cls.admin)
+        for number in range(3):
+            Comment.objects.create(
+                post=cls.post, author=cls.spammer, text=f'Buy pills {number}')
+        Comment.objects.create(
+            post=cls.post, author=cls.reader, text='Nice post')
+        Follow.objects.create(user=cls.reader, author=cls.admin)
+        Follow.objects.create(user=cls.spammer, author=cls.reader)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def changelist(self, model, **params):
+        response = self.client.get(
+            reverse(f'admin:posts_{model}_changelist'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.context['cl']
+
+    def test_comment_changelist(self):
+        """Комментарии ищутся по индексу и знают число комментариев автора."""
+        cl = self.changelist('comment', q='pills')
+        self.assertEqual(
+            {comment.author_comments_count for comment in cl.result_list},
+            {3},
+        )
+        self.assertEqual(cl.result_count, 3)
+        cl = self.changelist('comment')
+        self.assertEqual(
+            [comment.text for comment in cl.result_list][0], 'Nice post')
+
+    def test_follow_changelist(self):
+        """Подписки ищутся по точному имени подписчика или автора."""
+        cl = self.changelist('follow', q='reader')
+        self.assertEqual(len(cl.result_list), 2)
+        cl = self.changelist('follow', q='spammer')
+        follow, = cl.result_list
+        self.assertEqual(follow.author, self.reader)
+        self.assertContains(
+            self.client.get(reverse('admin:posts_follow_changelist')),
+            'Подписчиков автора')
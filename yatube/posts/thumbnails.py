@@ -0,0 +1,229 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.utils import timezone
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import (
+    EMPTY_VALUE, KVStore as CachedDBKVStore,
+)
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from .models import Post
+from .versions import bump
+
+logger = logging.getLogger(__name__)
+
+# Не ставить одну картинку в очередь чаще раза в столько секунд
+PENDING_KEY = 'posts:thumbnail:pending:{}'
+PENDING_TIMEOUT = 60
+
+_executor = None
+
+
+def executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.POSTS_THUMBNAIL_WORKERS,
+            thread_name_prefix='thumbnails',
+        )
+    return _executor
+
+
+def variants(name):
+    """Варианты миниатюры name: (ширина, формат, геометрия, опции).
+
+    Пропорции берутся из геометрии в POSTS_THUMBNAILS, ширины -
+    из POSTS_THUMBNAIL_WIDTHS, форматы - из POSTS_THUMBNAIL_FORMATS.
+    """
+    geometry, options = settings.POSTS_THUMBNAILS[name]
+    width, height = (int(side) for side in geometry.split('x'))
+    for variant_width in settings.POSTS_THUMBNAIL_WIDTHS:
+        variant_height = round(height * variant_width / width)
+        for image_format in settings.POSTS_THUMBNAIL_FORMATS:
+            yield (
+                variant_width,
+                image_format,
+                f'{variant_width}x{variant_height}',
+                {**options, 'format': image_format},
+            )
+
+
+def generate(name):
+    """Создаёт недостающие варианты миниатюр из POSTS_THUMBNAILS для name.
+
+    Возвращает False, если не получилось. Страницы записей
+    сбрасываются, только если что-то действительно создано:
+    повторный проход backfill_thumbnails не трогает кэш.
+    """
+    # Хранилище поля, а не sorl: иначе ключ миниатюры не совпадёт
+    # с тем, что ищет тег thumbnail в шаблоне
+    source = ImageFile(name, Post._meta.get_field('image').storage)
+    try:
+        wanted = [
+            (geometry, options,
+             add_prefix(thumbnail_file(source, geometry, options).key))
+            for thumbnail in settings.POSTS_THUMBNAILS
+            for _, _, geometry, options in variants(thumbnail)
+        ]
+        found = kvstore_get_many([key for _, _, key in wanted])
+        missing = [
+            (geometry, options) for geometry, options, key in wanted
+            if key not in found
+        ]
+        if not missing:
+            return True
+        # Без исходника sorl молча вернёт заглушку
+        if not source.exists():
+            logger.warning('Нет картинки %s для миниатюр', name)
+            return False
+        for geometry, options in missing:
+            get_thumbnail(source, geometry, **options)
+        refresh(name)
+    except Exception:
+        logger.exception('Не удалось создать миниатюры для %s', name)
+        return False
+    else:
+        return True
+
+
+def refresh(name):
+    """Сбрасывает страницы записей с картинкой name.
+
+    Пока миниатюр не было, страницы закэшированы с исходной
+    картинкой, а post_detail отдал её ETag.
+    """
+    posts = Post.objects.filter(image=name)
+    rows = list(posts.values_list('author_id', 'group_id'))
+    if not rows:
+        return
+    posts.update(updated=timezone.now())
+    scopes = {('all',)}
+    for author_id, group_id in rows:
+        scopes.add(('author', author_id))
+        if group_id:
+            scopes.add(('group', group_id))
+    bump(scopes)
+
+
+def schedule(name):
+    """Ставит создание миниатюр в пул после фиксации транзакции.
+
+    Запрос, который первым покажет запись, найдёт миниатюры готовыми
+    и не будет ждать PIL.
+    """
+    if name:
+        transaction.on_commit(lambda: executor().submit(generate, name))
+
+
+def thumbnail_file(source, geometry, options):
+    """Файл миниатюры под тем именем, что даст ему sorl.
+
+    Повторяет подготовку опций из ThumbnailBackend.get_thumbnail,
+    но не открывает исходную картинку.
+    """
+    backend = default.backend
+    options = dict(options)
+    if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(sorl_settings, attr)
+        if value != getattr(sorl_defaults, attr):
+            options.setdefault(key, value)
+    return ImageFile(
+        backend._get_thumbnail_filename(source, geometry, options),
+        default.storage,
+    )
+
+
+def kvstore_get_many(keys):
+    """Сырые значения хранилища sorl: один get_many и один запрос."""
+    kvstore = default.kvstore
+    if not isinstance(kvstore, CachedDBKVStore):
+        found = {key: kvstore._get_raw(key) for key in keys}
+        return {key: value for key, value in found.items() if value}
+    found = kvstore.cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        stored = dict(KVStoreModel.objects.filter(
+            key__in=missing).values_list('key', 'value'))
+        # Как и сам sorl, запоминаем в кэше и отсутствие значения
+        fetched = {key: stored.get(key, EMPTY_VALUE) for key in missing}
+        kvstore.cache.set_many(
+            fetched, sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+        found.update(fetched)
+    return {
+        key: value for key, value in found.items()
+        if value is not EMPTY_VALUE
+    }
+
+
+def resolve(posts, name='card'):
+    """Проставляет записям варианты миниатюры name.
+
+    Все варианты для всех записей ищутся в хранилище sorl одним
+    обращением. У записи появляются:
+    thumbnail - вариант наибольшей ширины в последнем формате из
+    POSTS_THUMBNAIL_FORMATS, для src;
+    thumbnail_srcset - srcset этого формата;
+    thumbnail_sources - остальные форматы для <source> в <picture>;
+    thumbnail_sizes - атрибут sizes;
+    thumbnail_width, thumbnail_height - размеры thumbnail для <img>,
+    без чтения файлов.
+    Пока готовы не все варианты, thumbnail - сама картинка,
+    thumbnail_ready - False, а создание ставится в пул: запрос
+    не ждёт PIL. Готовые миниатюры сбрасывают страницы записи,
+    см. refresh.
+    """
+    fallback_format = settings.POSTS_THUMBNAIL_FORMATS[-1]
+    files = []
+    for post in posts:
+        post.thumbnail = None
+        post.thumbnail_srcset = ''
+        post.thumbnail_sources = []
+        post.thumbnail_sizes = settings.POSTS_THUMBNAIL_SIZES
+        post.thumbnail_width = post.thumbnail_height = None
+        post.thumbnail_ready = True
+        if post.image:
+            source = ImageFile(post.image)
+            files.append((post, [
+                (width, image_format, add_prefix(thumbnail_file(
+                    source, geometry, options).key))
+                for width, image_format, geometry, options in variants(name)
+            ]))
+    found = kvstore_get_many(
+        [key for _, keys in files for _, _, key in keys])
+    for post, keys in files:
+        if not all(key in found for _, _, key in keys):
+            post.thumbnail = post.image
+            post.thumbnail_width = post.image_width
+            post.thumbnail_height = post.image_height
+            post.thumbnail_ready = False
+            if cache.add(PENDING_KEY.format(post.image.name), True,
+                         PENDING_TIMEOUT):
+                schedule(post.image.name)
+            continue
+        srcsets = {}
+        for width, image_format, key in keys:
+            thumbnail = deserialize_image_file(found[key])
+            srcsets.setdefault(image_format, []).append(
+                f'{thumbnail.url} {width}w')
+            if image_format == fallback_format:
+                # Размер записан в хранилище sorl, файл не открывается
+                post.thumbnail = thumbnail
+                post.thumbnail_width, post.thumbnail_height = thumbnail.size
+        post.thumbnail_srcset = ', '.join(srcsets.pop(fallback_format))
+        post.thumbnail_sources = [
+            {'type': f'image/{image_format.lower()}',
+             'srcset': ', '.join(srcset)}
+            for image_format, srcset in srcsets.items()
+        ]
@@ -0,0 +1,96 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.views.decorators.http import condition
+
+# Версии содержимого областей: ('all',), ('users',), ('groups',),
+# ('group', id), ('author', id). Версия меняется при любой правке
+# того, что показывают страницы области. Карточки записей ключуются
+# узкими областями ('author_name', id) и ('group_name', id): их меняет
+# только правка имени автора и названия группы.
+VERSION_KEY = 'posts:version:{}'
+PAGE_KEY = 'posts:page:{}'
+
+
+def version_key(scope):
+    return VERSION_KEY.format(':'.join(str(part) for part in scope))
+
+
+def new_version():
+    # Метка времени, а не 1: вытесненная из кэша версия не должна
+    # совпасть с той, под которой лежат старые страницы
+    return time.time_ns()
+
+
+def versions(scopes):
+    """Текущие версии областей одним обращением к кэшу."""
+    keys = [version_key(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    missing = {key: new_version() for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, None)
+        found.update(missing)
+    return [found[key] for key in keys]
+
+
+def bump(scopes):
+    """Меняет версии областей, делая их закэшированные страницы старыми."""
+    for scope in scopes:
+        try:
+            cache.incr(version_key(scope))
+        except ValueError:
+            # Версии нет в кэше - при чтении появится новая
+            pass
+
+
+def digest(parts):
+    return hashlib.md5(
+        ':'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def page_version(request, get_scopes, args, kwargs):
+    """Версия страницы по версиям её областей или None.
+
+    Считается один раз за запрос: её берут и ETag, и кэш страниц.
+    """
+    if not hasattr(request, '_page_version'):
+        request._page_version = None
+        if request.method in ('GET', 'HEAD'):
+            scopes = get_scopes(request, *args, **kwargs)
+            if scopes is not None:
+                # Шапка страницы зависит от пользователя
+                parts = [request.get_full_path(), request.user.pk]
+                request._page_version = digest(parts + versions(scopes))
+    return request._page_version
+
+
+def cache_by_version(get_scopes):
+    """Кэширует страницу, пока не изменится версия её областей.
+
+    get_scopes(request, *args, **kwargs) возвращает области страницы
+    или None, если страницу кэшировать не нужно. Версия страницы
+    отдаётся и как ETag: клиент с текущей версией получает 304
+    без обращения к кэшу страниц и к шаблонам.
+    """
+    def etag(request, *args, **kwargs):
+        return page_version(request, get_scopes, args, kwargs)
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            version = page_version(request, get_scopes, args, kwargs)
+            if version is None:
+                return view(request, *args, **kwargs)
+            key = PAGE_KEY.format(version)
+            response = cache.get(key)
+            if response is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code == 200 and not response.cookies:
+                    cache.set(
+                        key, response, settings.POSTS_PAGE_CACHE_TIMEOUT)
+            return response
+        return condition(etag_func=etag)(wrapper)
+    return decorator
@@ -1,51 +1,108 @@
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
-from .models import Post, Group, User, Follow
+from django.views.decorators.http import condition
+from .models import AuthorStats, Post, Group, User, Follow
 from .forms import PostForm, CommentForm
-from posts.helper import paginator
-from django.views.decorators.cache import cache_page
+from posts.feeds import follow_sources
+from posts.helper import CURSOR_PARAM, paginator, merged_paginator
+from posts.search import search as search_posts
+from posts.thumbnails import resolve
+from posts.versions import cache_by_version, digest, versions
 
 
-@cache_page(20)
+def group_scopes(request, slug):
+    group_id = Group.objects.filter(
+        slug=slug).values_list('pk', flat=True).first()
+    return group_id and [('group', group_id), ('users',)]
+
+
+def profile_scopes(request, username):
+    author_id = User.objects.filter(
+        username=username).values_list('pk', flat=True).first()
+    # ('users',) - шапка с именем того, кто смотрит страницу
+    return author_id and [('author', author_id), ('groups',), ('users',)]
+
+
+@cache_by_version(lambda request: [('all',)])
 def index(request):
-    post_list = Post.objects.all()
+    post_list = Post.objects.feed()
     # В словаре context отправляем информацию в шаблон
     return render(
         request,
         'posts/index.html',
-        {'page_obj': paginator(request, post_list)},
+        {'page_obj': paginator(request, post_list, ('all',))},
     )
 
 
+@cache_by_version(group_scopes)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = Post.objects.filter(group=group)
+    posts = group.posts.feed()
     context = {
         'group': group,
-        'page_obj': paginator(request, posts),
+        'page_obj': paginator(request, posts, ('group', group.pk)),
     }
     return render(request, 'posts/group_list.html', context)
 
 
+@cache_by_version(profile_scopes)
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    post_list = author.posts.all()
+    author = get_object_or_404(
+        User.objects.select_related('stats'), username=username)
+    post_list = author.posts.feed()
     following = request.user.is_authenticated and Follow.objects.filter(
         user=request.user, author=author).exists()
     context = {
-        'page_obj': paginator(request, post_list),
+        'page_obj': paginator(request, post_list, ('author', author.pk)),
         'author': author,
+        'stats': AuthorStats.for_user(author),
         'following': following,
     }
     return render(request, 'posts/profile.html', context)
 
 
+def search(request):
+    query = request.GET.get('q', '').strip()
+    posts, next_cursor = search_posts(
+        query, request.GET.get(CURSOR_PARAM), settings.POSTS_LIMIT)
+    context = {
+        'query': query,
+        'posts': posts,
+        'next_cursor': next_cursor,
+    }
+    return render(request, 'posts/search.html', context)
+
+
+def post_etag(request, post_id):
+    """Версия страницы записи для того, кто её смотрит.
+
+    Кроме самой записи страница показывает число записей автора,
+    название группы и шапку с именем того, кто смотрит, поэтому
+    Last-Modified по дате записи для неё не годится.
+    """
+    row = Post.objects.filter(pk=post_id).values_list(
+        'updated', 'author_id', 'group_id').first()
+    if row is None:
+        return None
+    updated, author_id, group_id = row
+    scopes = [('author', author_id), ('users',)]
+    if group_id:
+        scopes.append(('group_name', group_id))
+    return digest([
+        updated.timestamp(), digest(versions(scopes)), request.user.pk])
+
+
+@condition(etag_func=post_etag)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'), id=post_id)
+    resolve([post])
     form = CommentForm()
     comment = post.comments.filter(post_id=post_id)
     context = {
         'post': post,
+        'stats': AuthorStats.for_user(post.author),
         'form': form,
         'comment': comment,
     }
@@ -102,12 +159,10 @@ def add_comment(request, post_id):
 
 @login_required
 def follow_index(request):
-    post_list = Post.objects.filter(author__following__user=request.user)
-    return render(
-        request,
-        'posts/follow.html',
-        {'page_obj': paginator(request, post_list)},
-    )
+    # Лента заранее разложена по FeedEntry: чтение - проход по индексу
+    # (user, -pub_date, -post), записи популярных авторов подмешиваются
+    page_obj = merged_paginator(request, follow_sources(request.user))
+    return render(request, 'posts/follow.html', {'page_obj': page_obj})
 
 
 @login_required
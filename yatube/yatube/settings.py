@@ -39,6 +39,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -54,7 +55,7 @@ ROOT_URLCONF = 'yatube.urls'
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.metrics.TimedDjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -133,12 +134,63 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
 POSTS_LIMIT: int = 10
+# Счётчики записей для пагинатора: сколько строк считать точно
+# и сколько держать результат в кэше (сигналы поправляют его сразу)
+POSTS_COUNT_EXACT_LIMIT: int = 10000
+POSTS_COUNT_TIMEOUT: int = 60 * 60
+# С этого числа подписчиков записи автора не раскладываются по лентам,
+# а подтягиваются при чтении; None - раскладывать всегда.
+# После изменения порога выполните manage.py rebuild_feeds
+FEED_PULL_THRESHOLD = 1000
+# Сколько хранить страницы лент: они сбрасываются сменой версии
+# содержимого, поэтому срок нужен только для вытеснения мусора
+POSTS_PAGE_CACHE_TIMEOUT = None
+# Карточки записей ключуются датой изменения записи
+POSTS_CARD_CACHE_TIMEOUT: int = 24 * 60 * 60
+# Миниатюры записей: создаются сразу после загрузки картинки,
+# шаблоны берут их по имени через posts.thumbnails.resolve
+POSTS_THUMBNAILS = {
+    'card': ('960x339', {'crop': 'center', 'upscale': True}),
+}
+# Каждая миниатюра создаётся в этих ширинах (по возрастанию) и форматах;
+# последний формат - запасной для <img>, остальные идут в <source>
+POSTS_THUMBNAIL_WIDTHS = [480, 960]
+POSTS_THUMBNAIL_FORMATS = ['WEBP', 'JPEG']
+POSTS_THUMBNAIL_SIZES = '(max-width: 768px) 100vw, 720px'
+# Загруженные картинки уменьшаются до этих размеров
+# и перекодируются с этим качеством
+POSTS_IMAGE_MAX_SIZE = (2048, 2048)
+POSTS_IMAGE_QUALITY: int = 85
+# Размер размытой заглушки, что видна, пока грузится картинка
+POSTS_IMAGE_PLACEHOLDER_SIZE = (16, 16)
+# Картинку моложе этого (в секундах) удаление записи не трогает:
+# одинаковая загрузка могла только что получить то же имя, а её
+# запись ещё не сохранена. Такие файлы подберёт manage.py gc_media
+POSTS_IMAGE_RELEASE_AGE: int = 60 * 60
+POSTS_THUMBNAIL_WORKERS: int = 2
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Файловый кэш общий для всех процессов сервера на хосте.
+# Тесты подменяют его своим файлом, см. core.runner
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 50000,
+            'MAX_SIZE': 256 * 1024 * 1024,
+        },
     }
 }
+TEST_RUNNER = 'core.runner.TestRunner'
+
+# Метрики запросов для /metrics, общие для процессов хоста.
+# Процесс дописывает их в файл не чаще раза в METRICS_FLUSH_INTERVAL
+# секунд; None вместо пути выключает сбор
+METRICS_LOCATION = os.path.join(BASE_DIR, 'metrics.sqlite3')
+METRICS_FLUSH_INTERVAL: int = 10
+# Токен сборщика метрик: он передаёт его в Authorization: Bearer.
+# None - /metrics доступны только сотрудникам
+METRICS_TOKEN = None
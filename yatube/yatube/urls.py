@@ -3,12 +3,15 @@ from django.conf import settings
 from django.urls import path, include
 from django.conf.urls.static import static
 
+from core.views import metrics
+
 urlpatterns = [
     path('', include('posts.urls', namespace='posts')),
     path('admin/', admin.site.urls),
     path('auth/', include('users.urls')),
     path('auth/', include('django.contrib.auth.urls')),
     path('about/', include('about.urls', namespace='about')),
+    path('metrics', metrics, name='metrics'),
 ]
 handler404 = 'core.views.page_not_found'
 handler403 = 'core.views.permission_denied'